@@ -0,0 +1,141 @@
+# benchmarks/bench_article_encoding.py - Allocations and encode time per article feed
+#
+# Usage: python benchmarks/bench_article_encoding.py [--feed-size 30] [--iterations 2000]
+#
+# Builds a feed response body from real Firestore DocumentSnapshot objects
+# three ways: the previous path (to_dict(), mutate, Flask's JSON provider),
+# Article + FeedEncoder with a cold fragment cache, and with a warm one. Each
+# is measured as a plain /news feed and as a recommendations feed with
+# per-request annotations.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+import importlib.util
+from datetime import timedelta
+
+from flask import Flask
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1.base_document import DocumentSnapshot
+from google.cloud.firestore_v1.document import DocumentReference
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import CATEGORIES, SOURCES, headline, summary  # noqa: E402
+
+ARTICLES_PATH = os.path.join(os.path.dirname(__file__), '..', 'news-service', 'articles.py')
+spec = importlib.util.spec_from_file_location('articles', ARTICLES_PATH)
+articles = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(articles)
+
+PLACEHOLDER_IMAGE = 'https://via.placeholder.com/400x200?text=No+Image'
+
+
+def make_snapshots(n, rng):
+    now = DatetimeWithNanoseconds.now().astimezone()
+    snapshots = []
+    for i in range(n):
+        article_id = f"bench-article-{i:07d}"
+        category = rng.choice(CATEGORIES)
+        data = {
+            'article_id': article_id,
+            'title': headline(rng),
+            'content': summary(rng),
+            'category': category,
+            'publish_date': now - timedelta(seconds=rng.randint(0, 86400)),
+            'source': rng.choice(SOURCES),
+            'image_url': '' if i % 5 == 0 else f"https://img.example.com/{article_id}.jpg",
+            'url': f"https://news.example.com/{category}/{article_id}",
+            'author': 'Benchmark',
+            'created_at': now
+        }
+        reference = DocumentReference('articles', article_id, client=None)
+        snapshots.append(DocumentSnapshot(reference, data, True, now, now, now))
+    return snapshots
+
+
+def annotations(i):
+    return {
+        'recommendation_score': 10 + i / 7,
+        'recommendation_reason': "Based on your interest in technology",
+        'is_liked': i % 9 == 0
+    }
+
+
+def dict_feed(app, snapshots, annotate):
+    """The read path before Article: fresh dicts per request, then jsonify's encoder"""
+    result = []
+    for i, doc in enumerate(snapshots):
+        article_data = doc.to_dict()
+        if 'article_id' not in article_data:
+            article_data['article_id'] = doc.id
+        if not article_data.get('image_url', ''):
+            article_data['image_url'] = PLACEHOLDER_IMAGE
+        if annotate:
+            article_data.update(annotations(i))
+        result.append(article_data)
+    return app.json.dumps({"articles": result, "count": len(result), "category": "all"}).encode('utf-8')
+
+
+def article_feed(encoder, snapshots, annotate):
+    result = []
+    for i, doc in enumerate(snapshots):
+        article = articles.Article.from_snapshot(doc, PLACEHOLDER_IMAGE)
+        if annotate:
+            article.annotate(**annotations(i))
+        result.append(article)
+    return encoder.encode({"articles": result, "count": len(result), "category": "all"})
+
+
+def measure(build, iterations):
+    """Mean microseconds per feed, and peak traced allocation while building one"""
+    build()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build()
+    per_feed_us = (time.perf_counter() - start) / iterations * 1e6
+
+    tracemalloc.start()
+    body = build()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return per_feed_us, peak, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--feed-size', type=int, default=30)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    snapshots = make_snapshots(args.feed_size, rng)
+    app = Flask('bench')
+
+    with app.app_context():
+        # Same JSON document (annotation keys come after the cached fields, so not byte-identical)
+        assert json.loads(article_feed(articles.FeedEncoder(), snapshots, True)) == \
+            json.loads(dict_feed(app, snapshots, True)), "Article encoding differs from jsonify"
+
+        print(f"{args.feed_size}-article feed, {args.iterations:,} iterations\n")
+        print(f"{'path':46} {'us/feed':>10} {'peak KB':>9} {'bytes':>8}")
+        for annotate in (False, True):
+            label = 'recommendations' if annotate else 'news'
+            warm = articles.FeedEncoder()
+            cases = (
+                ('dict + jsonify', lambda: dict_feed(app, snapshots, annotate)),
+                # A fresh encoder per feed: every article is a cache miss
+                ('Article + FeedEncoder (cold)', lambda: article_feed(articles.FeedEncoder(), snapshots, annotate)),
+                ('Article + FeedEncoder (warm)', lambda: article_feed(warm, snapshots, annotate)),
+            )
+            for name, build in cases:
+                per_feed_us, peak, size = measure(build, args.iterations)
+                print(f"{label + ': ' + name:46} {per_feed_us:10.1f} {peak / 1024:9.1f} {size:8,}")
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# benchmarks/bench_degraded_backend.py - Feed latency and staleness while Firestore degrades
+#
+# Usage:
+#   python benchmarks/bench_degraded_backend.py --articles 5000 --users 2000 --concurrency 8 \
+#       --phase-seconds 10 --degraded-latency-ms 3000 --degraded-error-rate 0.3
+#   python benchmarks/bench_degraded_backend.py --check
+#
+# Runs GET /news and GET /users/me/recommendations through three phases
+# against the fake Firestore: healthy, degraded (slow and failing RPCs) and
+# recovered. Reports per phase and endpoint the latency percentiles, the
+# share of responses served stale from the last-known-good cache, and the
+# share of empty feeds. Breaker state transitions are logged as they happen.
+#
+# --check instead steps each service's breaker through closed -> open ->
+# half-open -> closed with injected failures, asserting that feeds are served
+# stale without touching Firestore while it is open, and that a failing read
+# is answered from the cache without further queries. Exits non-zero on failure.
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import Latency  # noqa: E402
+from harness import Environment, dump_json  # noqa: E402
+from run_load import percentile, scenario_news, scenario_recommendations  # noqa: E402
+
+ENDPOINTS = {
+    'news': ('news', scenario_news),
+    'recommendations': ('users', scenario_recommendations),
+}
+
+
+def run_phase(env, concurrency, duration):
+    """Run both endpoints concurrently for duration seconds"""
+    samples = {name: [] for name in ENDPOINTS}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        name = list(ENDPOINTS)[worker_id % len(ENDPOINTS)]
+        service, request_fn = ENDPOINTS[name]
+        client = getattr(env, service).app.test_client()
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = request_fn(env, client, rng)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            body = response.get_json(silent=True) or {}
+            local.append((elapsed_ms, bool(body.get('stale')), not body.get('articles')))
+        with lock:
+            samples[name].extend(local)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+
+    results = {}
+    for name, rows in samples.items():
+        latencies = sorted(row[0] for row in rows)
+        results[name] = {
+            'requests': len(rows),
+            'stale_share': round(sum(row[1] for row in rows) / len(rows), 3) if rows else None,
+            'empty_share': round(sum(row[2] for row in rows) / len(rows), 3) if rows else None,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1] if latencies else None
+            }
+        }
+    return results
+
+
+def check_breaker(name, breaker, request_fn, latency, open_seconds):
+    """Assert one service's breaker transitions and the stale feeds served while it is open"""
+    # Breaker state at every fake RPC the service makes
+    rpc_states = []
+    sleep = latency._sleep
+
+    def observed(mean_ms, timeout=None):
+        rpc_states.append(breaker.state)
+        return sleep(mean_ms, timeout)
+
+    latency._sleep = observed
+    try:
+        latency.error_rate = 0.0
+        body = request_fn()
+        assert breaker.state == 'closed', f"{name}: breaker {breaker.state} while healthy"
+        assert body.get('stale') is False and body.get('articles'), f"{name}: healthy feed not fresh: {body}"
+        # Let background refreshes started by the healthy request finish
+        time.sleep(0.5)
+
+        latency.error_rate = 1.0
+        for _ in range(breaker.window):
+            del rpc_states[:]
+            body = request_fn()
+            assert body.get('stale') is True and body.get('articles'), f"{name}: failed read not served stale: {body}"
+            # The first failed read is answered from the cache, not with fallback queries
+            assert len(rpc_states) == 1, f"{name}: a failing request made {len(rpc_states)} Firestore calls"
+            if breaker.state == 'open':
+                break
+        assert breaker.state == 'open', f"{name}: breaker {breaker.state} after {breaker.window} failing requests"
+
+        del rpc_states[:]
+        latency.error_rate = 0.0
+        body = request_fn()
+        assert not rpc_states, f"{name}: {len(rpc_states)} Firestore calls while the breaker was open"
+        assert body.get('stale') is True and body.get('stale_age_seconds') is not None, f"{name}: open breaker not served stale"
+
+        # After open_seconds a single probe goes through; a failed probe re-opens the breaker
+        time.sleep(open_seconds)
+        latency.error_rate = 1.0
+        del rpc_states[:]
+        body = request_fn()
+        assert rpc_states == ['half_open'], f"{name}: expected one half-open probe, saw {rpc_states}"
+        assert breaker.state == 'open', f"{name}: breaker {breaker.state} after a failed probe"
+        assert body.get('stale') is True, f"{name}: failed probe not served stale"
+
+        # A successful probe closes it and fresh feeds are served again
+        time.sleep(open_seconds)
+        latency.error_rate = 0.0
+        del rpc_states[:]
+        body = request_fn()
+        assert rpc_states and rpc_states[0] == 'half_open', f"{name}: first call after recovery wasn't a probe: {rpc_states}"
+        assert breaker.state == 'closed', f"{name}: breaker {breaker.state} after a successful probe"
+        assert body.get('stale') is False, f"{name}: feed still stale after the breaker closed"
+    finally:
+        latency._sleep = sleep
+        latency.error_rate = 0.0
+    print(f"ok  {name}: closed -> open (served stale, no Firestore calls) -> half-open -> open -> half-open -> closed")
+
+
+def run_checks(env, latency, open_seconds):
+    user = env.user_records[0]
+    news_client = env.news.app.test_client()
+    users_client = env.users.app.test_client()
+    checks = (
+        ('news', env.news.firestore_breaker,
+         lambda: news_client.get('/news?category=all&limit=30').get_json()),
+        ('recommendations', env.users.firestore_breaker,
+         lambda: users_client.get('/users/me/recommendations', headers={
+             'Authorization': f"Bearer {env.tokens[user['user_id']]}"}).get_json()),
+    )
+    failed = 0
+    for name, breaker, request_fn in checks:
+        try:
+            check_breaker(name, breaker, request_fn, latency, open_seconds)
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {e}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--phase-seconds', type=float, default=10)
+    parser.add_argument('--read-latency-ms', type=float, default=5)
+    parser.add_argument('--query-latency-ms', type=float, default=20)
+    parser.add_argument('--degraded-latency-ms', type=float, default=3000,
+                        help="read and query latency while degraded")
+    parser.add_argument('--degraded-error-rate', type=float, default=0.3)
+    parser.add_argument('--timeout-seconds', type=float, default=1.0, help="FIRESTORE_TIMEOUT_SECONDS")
+    parser.add_argument('--open-seconds', type=float, default=3.0, help="CIRCUIT_OPEN_SECONDS")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--check', action='store_true', help="assert breaker transitions instead of benchmarking")
+    args = parser.parse_args()
+
+    os.environ['FIRESTORE_TIMEOUT_SECONDS'] = str(args.timeout_seconds)
+    os.environ['FIRESTORE_SLOW_CALL_SECONDS'] = str(args.timeout_seconds)
+    os.environ['CIRCUIT_OPEN_SECONDS'] = str(args.open_seconds)
+
+    latency = Latency(read_ms=args.read_latency_ms, query_ms=args.query_latency_ms)
+    env = Environment(latency=latency)
+    logging.getLogger().setLevel(logging.WARNING)
+    env.seed(args.articles, args.users)
+    print(f"Seeded {args.articles:,} articles and {args.users:,} users; state in {env.state_dir}")
+    if args.check:
+        return run_checks(env, latency, args.open_seconds)
+
+    healthy = (latency.read_ms, latency.query_ms, latency.error_rate)
+    degraded = (args.degraded_latency_ms, args.degraded_latency_ms, args.degraded_error_rate)
+    report = {'config': vars(args), 'phases': {}}
+
+    for phase, (read_ms, query_ms, error_rate) in (('healthy', healthy), ('degraded', degraded), ('recovered', healthy)):
+        latency.read_ms, latency.query_ms, latency.error_rate = read_ms, query_ms, error_rate
+        if phase == 'recovered':
+            # Give the open breakers time to let a probe through
+            time.sleep(args.open_seconds)
+        results = run_phase(env, args.concurrency, args.phase_seconds)
+        report['phases'][phase] = results
+        for name, result in results.items():
+            latency_ms = result['latency_ms']
+            print(f"{phase:10} {name:16} {result['requests']:>6,} req  stale {result['stale_share'] or 0:6.1%}  "
+                  f"empty {result['empty_share'] or 0:6.1%}  p50 {latency_ms['p50'] or 0:8.2f} ms  "
+                  f"p95 {latency_ms['p95'] or 0:8.2f} ms  p99 {latency_ms['p99'] or 0:8.2f} ms")
+        print(f"{'':10} breakers: news {env.news.firestore_breaker.state}, users {env.users.firestore_breaker.state}")
+
+    if args.output:
+        dump_json(args.output, report)
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# benchmarks/bench_rate_limit.py - Per-request overhead of the rate limiting middleware
+#
+# Usage: python benchmarks/bench_rate_limit.py [--keys 10000] [--iterations 200000]
+#                                             [--redis-url redis://localhost:6379/0]
+#        python benchmarks/bench_rate_limit.py --check
+#
+# Times the sliding-window check on its own and as the before_request hook of
+# a Flask app (route lookup, client IP or user key, counter update), for
+# allowed and rejected requests. With --redis-url the shared backend is timed
+# too; that cost is dominated by the round trip to the server.
+#
+# --check instead fills counters with random traffic until a request is
+# rejected and asserts that its Retry-After is exact: a retry one second
+# earlier is still rejected and a retry after Retry-After seconds is accepted.
+# It also asserts which requests share a counter. Exits non-zero on failure.
+import os
+import sys
+import time
+import random
+import argparse
+import importlib.util
+
+from flask import Flask, request
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'news-service')
+RATE_LIMIT_PATH = os.path.join(SERVICE_DIR, 'rate_limit.py')
+# rate_limit imports resilience from the same directory
+sys.path.insert(0, SERVICE_DIR)
+spec = importlib.util.spec_from_file_location('rate_limit', RATE_LIMIT_PATH)
+rate_limit = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(rate_limit)
+
+
+def per_call_us(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_backend(backend, keys, iterations):
+    """Allowed hits spread over many keys, then hits on one exhausted key"""
+    quota = rate_limit.Quota(10 ** 9, 60)
+    key_names = [f"/engagement|ip:10.0.{i // 256}.{i % 256}" for i in range(keys)]
+    position = [0]
+
+    def allowed():
+        position[0] = (position[0] + 1) % keys
+        backend.hit(key_names[position[0]], quota, time.time())
+
+    exhausted = rate_limit.Quota(1, 60)
+    backend.hit('exhausted', exhausted, time.time())
+    return (per_call_us(allowed, iterations),
+            per_call_us(lambda: backend.hit('exhausted', exhausted, time.time()), iterations))
+
+
+def bench_middleware(backend, keys, iterations, identity):
+    """RateLimiter.check() under pushed request contexts, as Flask runs it"""
+    app = Flask('bench')
+
+    @app.route('/engagement', methods=['POST'])
+    def engagement():
+        return '', 204
+
+    @app.route('/health')
+    def health():
+        return '', 200
+
+    quotas = {'/engagement': rate_limit.Quota(10 ** 9, 60)}
+    limiter = rate_limit.RateLimiter(app, quotas, backend=backend, identity=identity)
+
+    contexts = [app.test_request_context('/engagement', method='POST',
+                                         headers={'X-Forwarded-For': f"10.1.{i // 256}.{i % 256}"})
+                for i in range(min(keys, 1000))]
+    per_context = max(1, iterations // len(contexts))
+
+    def run(contexts_to_use):
+        total = 0.0
+        for ctx in contexts_to_use:
+            ctx.push()
+            try:
+                total += per_call_us(limiter.check, per_context) * per_context
+            finally:
+                ctx.pop()
+        return total / (per_context * len(contexts_to_use))
+
+    allowed_us = run(contexts)
+
+    # A route without a quota: only the rule lookup
+    with app.test_request_context('/health'):
+        unlimited_us = per_call_us(limiter.check, iterations)
+
+    # Rejections build the 429 response
+    limiter.quotas['/engagement'] = rate_limit.Quota(0, 60)
+    rejected_us = run(contexts[:10])
+    return allowed_us, unlimited_us, rejected_us
+
+
+def check_retry_after(trials):
+    """Assert Retry-After against MemoryBackend for random quotas and traffic"""
+    rng = random.Random(0)
+    quotas = [rate_limit.Quota(1, 1), rate_limit.Quota(5, 10), rate_limit.Quota(10, 60),
+              rate_limit.Quota(120, 60), rate_limit.Quota(1000, 3600)]
+    failures = 0
+    for quota in quotas:
+        failed_before = failures
+        for trial in range(trials):
+            backend = rate_limit.MemoryBackend()
+            # Some traffic in the previous window, then hits until one is rejected
+            now = rng.uniform(0, 10 ** 6)
+            for _ in range(rng.randint(0, quota.limit)):
+                backend.hit('client', quota, now - rng.uniform(0, quota.window))
+            allowed, retry = True, 0
+            while allowed:
+                now += rng.choice((0, rng.uniform(0, quota.window / quota.limit)))
+                allowed, retry = backend.hit('client', quota, now)
+            # A rejected hit isn't counted, so probing doesn't change the outcome
+            early, _ = backend.hit('client', quota, now + retry - 1) if retry > 1 else (False, 0)
+            on_time, again = backend.hit('client', quota, now + retry)
+            if early or not on_time:
+                failures += 1
+                if failures <= 10:
+                    problem = 'accepted one second early' if early else f"retry rejected (Retry-After {again})"
+                    print(f"FAIL {quota!r} at {now:.3f}: Retry-After {retry}, {problem}")
+        print(f"{'ok' if failures == failed_before else '  '}  {quota!r}: {trials:,} rejections")
+    return 1 if failures else 0
+
+
+def check_keys():
+    """Assert that ip_routes ignore the caller's identity, shared_routes its IP, and others count per user"""
+    app = Flask('check')
+
+    @app.route('/auth/login', methods=['POST'])
+    def login():
+        return '', 204
+
+    @app.route('/engagement', methods=['POST'])
+    def engagement():
+        return '', 204
+
+    @app.route('/news/fetch', methods=['POST'])
+    def fetch():
+        return '', 204
+
+    quotas = {route: rate_limit.Quota(3, 60) for route in ('/auth/login', '/engagement', '/news/fetch')}
+    rate_limit.RateLimiter(app, quotas, identity=lambda: request.headers.get('X-User'),
+                           ip_routes=('/auth/login',), shared_routes=('/news/fetch',))
+    client = app.test_client()
+
+    def statuses(path, headers_list):
+        return [client.post(path, headers=headers).status_code for headers in headers_list]
+
+    # A fresh identity per request, all from one IP
+    rotating = [{'X-User': f"user-{i}", 'X-Forwarded-For': '10.0.0.1'} for i in range(4)]
+    # A fresh IP per request
+    spread = [{'X-Forwarded-For': f"10.0.0.{i}"} for i in range(4)]
+    cases = (
+        ('/auth/login: rotating tokens share the IP quota', statuses('/auth/login', rotating), [204, 204, 204, 429]),
+        ('/engagement: counted per user', statuses('/engagement', rotating), [204, 204, 204, 204]),
+        ('/news/fetch: one quota for all IPs', statuses('/news/fetch', spread), [204, 204, 204, 429]),
+    )
+    failures = 0
+    for label, got, expected in cases:
+        ok = got == expected
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL'}  {label}" + ('' if ok else f": {got}, expected {expected}"))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=10000, help="distinct clients")
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--redis-url', help="also time the Redis backend against this server")
+    parser.add_argument('--check', action='store_true', help="assert Retry-After instead of benchmarking")
+    args = parser.parse_args()
+
+    if args.check:
+        failed = check_retry_after(trials=2000)
+        return 1 if check_keys() or failed else 0
+
+    backends = [('memory', rate_limit.MemoryBackend)]
+    if args.redis_url:
+        backends.append(('redis', lambda: rate_limit.RedisBackend(args.redis_url)))
+
+    print(f"{args.keys:,} distinct clients, {args.iterations:,} iterations\n")
+    print(f"{'case':44} {'us/request':>11}")
+    for name, make_backend in backends:
+        iterations = args.iterations if name == 'memory' else max(1000, args.iterations // 100)
+        allowed_us, rejected_us = bench_backend(make_backend(), args.keys, iterations)
+        print(f"{name + ' backend: allowed':44} {allowed_us:11.2f}")
+        print(f"{name + ' backend: rejected':44} {rejected_us:11.2f}")
+
+        for label, identity in (('per IP', None), ('per user', lambda: 'bench-user-0000001')):
+            allowed_us, unlimited_us, rejected_us = bench_middleware(make_backend(), args.keys, iterations, identity)
+            print(f"{name + ' middleware ' + label + ': allowed':44} {allowed_us:11.2f}")
+            print(f"{name + ' middleware ' + label + ': rejected (429)':44} {rejected_us:11.2f}")
+        print(f"{name + ' middleware: route without quota':44} {unlimited_us:11.2f}")
+        print()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# benchmarks/bench_recommendation_job.py - Runtime and memory of the item-item neighbor job
+#
+# Usage: python benchmarks/bench_recommendation_job.py [--users 100000] [--articles 50000]
+import os
+import time
+import argparse
+import tracemalloc
+import importlib.util
+
+import numpy as np
+
+JOB_PATH = os.path.join(os.path.dirname(__file__), '..', 'recommendation-job', 'main.py')
+spec = importlib.util.spec_from_file_location('recommendation_job', JOB_PATH)
+recommendation_job = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(recommendation_job)
+
+
+def synthetic_interactions(n_users, n_articles, mean_per_user, seed=42):
+    """Users with a long-tailed number of interactions on Zipf-popular articles"""
+    rng = np.random.default_rng(seed)
+    per_user = np.minimum(rng.geometric(1.0 / mean_per_user, size=n_users), 500)
+    rows = np.repeat(np.arange(n_users, dtype=np.int32), per_user)
+
+    popularity = 1.0 / np.arange(1, n_articles + 1) ** 0.8
+    popularity /= popularity.sum()
+    cols = rng.choice(n_articles, size=len(rows), p=popularity).astype(np.int32)
+
+    event_types = np.array(list(recommendation_job.EVENT_WEIGHTS))
+    events = rng.choice(event_types, size=len(rows), p=[0.3, 0.1, 0.6])
+    return rows, cols, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--articles', type=int, default=50000)
+    parser.add_argument('--per-user', type=float, default=20)
+    parser.add_argument('--k', type=int, default=20)
+    args = parser.parse_args()
+
+    rows, cols, events = synthetic_interactions(args.users, args.articles, args.per_user)
+    article_ids = [f"article-{i}" for i in range(args.articles)]
+    print(f"{args.users:,} users x {args.articles:,} articles, {len(rows):,} interactions")
+
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    interactions = recommendation_job.InteractionMatrix()
+    for user, article, event_type in zip(rows.tolist(), cols.tolist(), events.tolist()):
+        interactions.add(user, article_ids[article], event_type)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = interactions.to_csr()
+    csr_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    neighbor_indices, neighbor_scores = recommendation_job.top_k_neighbors(matrix, k=args.k)
+    similarity_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lists = list(recommendation_job.neighbor_lists(interactions.article_ids, neighbor_indices, neighbor_scores))
+    output_seconds = time.perf_counter() - start
+
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    neighbors_per_article = np.mean([len(neighbors) for _, neighbors in lists]) if lists else 0
+    print(f"csr:                {matrix.shape[0]:,} x {matrix.shape[1]:,}, nnz {matrix.nnz:,}")
+    print(f"load interactions:  {load_seconds:.1f}s")
+    print(f"build csr:          {csr_seconds:.1f}s")
+    print(f"top-k similarity:   {similarity_seconds:.1f}s")
+    print(f"neighbor lists:     {output_seconds:.1f}s ({len(lists):,} articles, "
+          f"{neighbors_per_article:.1f} neighbors each)")
+    print(f"peak memory:        {peak_bytes / 1e6:,.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_search_index.py - Query latency and memory of the search index
+#
+# Usage: python benchmarks/bench_search_index.py [--sizes 100000 1000000] [--queries 500]
+import os
+import sys
+import time
+import random
+import argparse
+import itertools
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'news-service'))
+
+from search_index import InvertedIndex  # noqa: E402
+
+CATEGORIES = ['technology', 'business', 'sports', 'entertainment', 'science']
+SOURCES = ['Reuters', 'BBC News', 'The Verge', 'ESPN', 'Bloomberg', 'Wired', 'CNN', 'Variety']
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def make_text(vocab, cum_weights, length, rng):
+    return ' '.join(rng.choices(vocab, cum_weights=cum_weights, k=length))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(size, n_queries, seed=42):
+    rng = random.Random(seed)
+    vocab = make_vocabulary(50000, rng)
+    # Zipf-like term distribution, like natural language
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocab))))
+
+    tracemalloc.start()
+    index = InvertedIndex()
+    start = time.perf_counter()
+    for i in range(size):
+        index.add(
+            f"article-{i}",
+            title=make_text(vocab, cum_weights, rng.randint(6, 14), rng),
+            content=make_text(vocab, cum_weights, rng.randint(20, 40), rng),
+            source=rng.choice(SOURCES),
+            category=rng.choice(CATEGORIES)
+        )
+    build_seconds = time.perf_counter() - start
+    index_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'index.pkl')
+        start = time.perf_counter()
+        index.save(path)
+        save_seconds = time.perf_counter() - start
+        snapshot_bytes = os.path.getsize(path)
+        start = time.perf_counter()
+        InvertedIndex.load(path)
+        load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(n_queries):
+        # Mix common and rare terms, two or three terms per query
+        query = ' '.join(vocab[min(int(rng.paretovariate(1.0)) * 10, len(vocab) - 1)] if rng.random() < 0.5
+                         else rng.choice(vocab) for _ in range(rng.randint(2, 3)))
+        start = time.perf_counter()
+        index.search(query, k=10)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    stats = index.stats()
+    print(f"\n=== {size:,} articles ===")
+    print(f"terms:            {stats['terms']:,}")
+    print(f"build:            {build_seconds:.1f}s ({size / build_seconds:,.0f} docs/s)")
+    print(f"index memory:     {index_bytes / 1e6:,.1f} MB ({index_bytes / size:,.0f} B/doc)")
+    print(f"posting lists:    {stats['posting_bytes'] / 1e6:,.1f} MB")
+    print(f"snapshot:         {snapshot_bytes / 1e6:,.1f} MB, save {save_seconds:.2f}s, load {load_seconds:.2f}s")
+    print(f"query latency ms: p50 {percentile(latencies, 50):.2f}  p95 {percentile(latencies, 95):.2f}  "
+          f"p99 {percentile(latencies, 99):.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.queries)
@@ -0,0 +1,359 @@
+# benchmarks/fakes.py - In-memory Firestore, Pub/Sub and BigQuery clients
+#
+# Drop-in stand-ins for the parts of google-cloud-firestore, -pubsub and
+# -bigquery the services use, with configurable injected latency and errors
+# per RPC so benchmarks can approximate a real (or degraded) backend without GCP.
+import time
+import random
+import threading
+import uuid
+from datetime import datetime, timezone
+from concurrent.futures import Future
+
+from google.api_core import exceptions
+from google.cloud import firestore
+
+
+class Latency:
+    """Sleep injected before each fake RPC: mean_ms +/- jitter (uniform).
+
+    A share error_rate of RPCs fails with ServiceUnavailable, and an RPC whose
+    delay exceeds the caller's timeout fails with DeadlineExceeded after
+    waiting out the timeout, as the real clients do.
+    """
+
+    def __init__(self, read_ms=0.0, write_ms=0.0, query_ms=0.0, jitter=0.25, error_rate=0.0):
+        self.read_ms = read_ms
+        self.write_ms = write_ms
+        self.query_ms = query_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.enabled = True
+
+    def _sleep(self, mean_ms, timeout=None):
+        if not self.enabled:
+            return
+        if self.error_rate and random.random() < self.error_rate:
+            raise exceptions.ServiceUnavailable("injected backend error")
+        if mean_ms > 0:
+            delay = mean_ms * random.uniform(1 - self.jitter, 1 + self.jitter) / 1000
+            if timeout is not None and delay > timeout:
+                time.sleep(timeout)
+                raise exceptions.DeadlineExceeded(f"injected delay {delay:.2f}s exceeded {timeout:.2f}s timeout")
+            time.sleep(delay)
+
+    def read(self, timeout=None):
+        self._sleep(self.read_ms, timeout)
+
+    def write(self, timeout=None):
+        self._sleep(self.write_ms, timeout)
+
+    def query(self, timeout=None):
+        self._sleep(self.query_ms, timeout)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _copy(data):
+    """Fresh dict per read, as the real client returns"""
+    return {k: (list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v) for k, v in data.items()}
+
+
+def _store_value(value, current=None):
+    """Apply Firestore sentinels/transforms and normalize values like the server does"""
+    if value is firestore.SERVER_TIMESTAMP:
+        return _now()
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    if isinstance(value, firestore.ArrayUnion):
+        existing = list(current or [])
+        return existing + [v for v in value.values if v not in existing]
+    if isinstance(value, firestore.ArrayRemove):
+        return [v for v in (current or []) if v not in value.values]
+    if isinstance(value, firestore.Increment):
+        return (current or 0) + value.value
+    return value
+
+
+class FakeSnapshot:
+
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        # Like the real client: None for a missing document, KeyError for a missing field
+        if self._data is None:
+            return None
+        value = self._data
+        for name in field.split('.'):
+            value = value[name]
+        return _copy(value)
+
+
+class FakeDocumentReference:
+
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self, timeout=None, **kwargs):
+        self._client.latency.read(timeout)
+        return self._client._snapshot(self._collection, self.id)
+
+    def set(self, data, merge=False):
+        self._client.latency.write()
+        self._client._write(self._collection, self.id, data, merge=merge)
+
+    def update(self, data):
+        self._client.latency.write()
+        self._client._update(self._collection, self.id, data)
+
+    def delete(self):
+        self._client.latency.write()
+        self._client._delete(self._collection, self.id)
+
+
+class FakeQuery:
+
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, start_after=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy_with(self, **changes):
+        params = dict(filters=self._filters, orders=self._orders, limit=self._limit, start_after=self._start_after)
+        params.update(changes)
+        return FakeQuery(self._client, self._collection, **params)
+
+    def where(self, field, op, value):
+        return self._copy_with(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy_with(orders=self._orders + ((field, direction),))
+
+    def limit(self, count):
+        return self._copy_with(limit=count)
+
+    def start_after(self, snapshot_or_values):
+        return self._copy_with(start_after=snapshot_or_values)
+
+    def select(self, field_paths):
+        # Snapshots carry every field; projection only saves bandwidth
+        return self._copy_with()
+
+    def stream(self, timeout=None, **kwargs):
+        self._client.latency.query(timeout)
+        ids = self._client._query_ids(self._collection, self._filters, self._orders)
+        if self._start_after is not None:
+            if isinstance(self._start_after, dict):
+                # Only document ID cursors are supported
+                after_id = self._start_after.get('__name__')
+                ids = [doc_id for doc_id in ids if doc_id > after_id]
+            else:
+                after_id = getattr(self._start_after, 'id', None)
+                if after_id in ids:
+                    ids = ids[ids.index(after_id) + 1:]
+        if self._limit is not None:
+            ids = ids[:self._limit]
+        return iter([self._client._snapshot(self._collection, doc_id) for doc_id in ids])
+
+    def get(self, timeout=None, **kwargs):
+        return list(self.stream(timeout=timeout))
+
+
+class FakeCollectionReference(FakeQuery):
+
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._client, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+
+class FakeWriteBatch:
+
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(('update', reference, data, None))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, None))
+
+    def commit(self):
+        self._client.latency.write()
+        for op, reference, data, merge in self._ops:
+            if op == 'set':
+                self._client._write(reference._collection, reference.id, data, merge=merge)
+            elif op == 'update':
+                self._client._update(reference._collection, reference.id, data)
+            else:
+                self._client._delete(reference._collection, reference.id)
+        self._ops = []
+
+
+def _field(doc_id, data, field):
+    """Field value for filtering/ordering; __name__ is the document ID"""
+    return doc_id if field == '__name__' else data.get(field)
+
+
+_OPS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: b in (a or []),
+}
+
+
+class FakeFirestoreClient:
+    """Thread-safe in-memory Firestore supporting the queries the services run.
+
+    Query results are cached per (collection, filters, order) and invalidated
+    by any write to that collection, so the fake's own CPU cost stays small
+    next to the injected latency on read-heavy benchmarks.
+    """
+
+    def __init__(self, project=None, latency=None, **kwargs):
+        self.project = project or 'benchmark'
+        self.latency = latency or Latency()
+        self._lock = threading.RLock()
+        self._collections = {}
+        self._update_times = {}
+        self._versions = {}
+        self._query_cache = {}
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, timeout=None, **kwargs):
+        references = list(references)
+        self.latency.read(timeout)
+        return iter([self._snapshot(ref._collection, ref.id) for ref in references])
+
+    def count(self, collection):
+        return len(self._collections.get(collection, {}))
+
+    # Storage
+
+    def _snapshot(self, collection, doc_id):
+        with self._lock:
+            data = self._collections.get(collection, {}).get(doc_id)
+            update_time = self._update_times.get((collection, doc_id))
+        return FakeSnapshot(FakeDocumentReference(self, collection, doc_id), data, update_time)
+
+    def _touch(self, collection, doc_id):
+        self._update_times[(collection, doc_id)] = _now()
+        self._versions[collection] = self._versions.get(collection, 0) + 1
+
+    def _write(self, collection, doc_id, data, merge=False):
+        with self._lock:
+            docs = self._collections.setdefault(collection, {})
+            current = docs.get(doc_id) if merge else None
+            stored = dict(current or {})
+            for key, value in data.items():
+                stored[key] = _store_value(value, stored.get(key))
+            docs[doc_id] = stored
+            self._touch(collection, doc_id)
+
+    def _update(self, collection, doc_id, data):
+        with self._lock:
+            docs = self._collections.get(collection, {})
+            if doc_id not in docs:
+                raise KeyError(f"No document to update: {collection}/{doc_id}")
+            stored = docs[doc_id]
+            for key, value in data.items():
+                stored[key] = _store_value(value, stored.get(key))
+            self._touch(collection, doc_id)
+
+    def _delete(self, collection, doc_id):
+        with self._lock:
+            if self._collections.get(collection, {}).pop(doc_id, None) is not None:
+                self._update_times.pop((collection, doc_id), None)
+                self._touch(collection, doc_id)
+
+    def _query_ids(self, collection, filters, orders):
+        key = (collection, repr(filters), orders)
+        with self._lock:
+            version = self._versions.get(collection, 0)
+            cached = self._query_cache.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            docs = self._collections.get(collection, {})
+            matches = [
+                (doc_id, data) for doc_id, data in docs.items()
+                if all(_OPS[op](_field(doc_id, data, field), value) for field, op, value in filters)
+            ]
+            # Sort by each order key, least significant first (stable sort)
+            for field, direction in reversed(orders):
+                matches = [m for m in matches if _field(m[0], m[1], field) is not None]
+                matches.sort(key=lambda m: _field(m[0], m[1], field), reverse=(direction == firestore.Query.DESCENDING))
+            ids = [doc_id for doc_id, _ in matches]
+            self._query_cache[key] = (version, ids)
+            return ids
+
+
+class FakePublisherClient:
+    """Pub/Sub publisher that delivers messages to in-process subscribers"""
+
+    def __init__(self, latency=None, subscribers=(), **kwargs):
+        self.latency = latency or Latency()
+        self.subscribers = list(subscribers)
+        self.published = 0
+        self._lock = threading.Lock()
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data, **attributes):
+        self.latency.write()
+        with self._lock:
+            self.published += 1
+            message_id = str(self.published)
+        for subscriber in self.subscribers:
+            subscriber(topic, data, attributes)
+        future = Future()
+        future.set_result(message_id)
+        return future
+
+
+class FakeBigQueryClient:
+    """BigQuery client that keeps streamed rows in memory"""
+
+    def __init__(self, latency=None, **kwargs):
+        self.latency = latency or Latency()
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def insert_rows_json(self, table, rows):
+        self.latency.write()
+        with self._lock:
+            self.rows.setdefault(str(table), []).extend(rows)
+        return []
@@ -0,0 +1,227 @@
+# benchmarks/harness.py - Load the services in-process against fake GCP backends
+#
+# The services create their Firestore, Pub/Sub and BigQuery clients at import
+# time, so the harness patches the client classes while importing each
+# service's main.py. Setting FIRESTORE_EMULATOR_HOST (or passing
+# firestore_emulator) uses the Firestore emulator instead of the in-memory fake.
+import os
+import sys
+import json
+import time
+import base64
+import random
+import tempfile
+import importlib.util
+from types import SimpleNamespace
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+
+import bcrypt
+from google.cloud import firestore, pubsub_v1
+
+from fakes import Latency, FakeFirestoreClient, FakePublisherClient, FakeBigQueryClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIES = ['technology', 'business', 'sports', 'entertainment', 'science']
+SOURCES = ['Reuters', 'BBC News', 'The Verge', 'ESPN', 'Bloomberg', 'Wired', 'CNN', 'Variety']
+WORDS = ("market launch team season study data court deal phone model storm film vote "
+         "growth energy space league chip album trial health city bank rocket star climate").split()
+PASSWORD = 'benchmark-password'
+SEED_BATCH_SIZE = 500
+
+
+def load_service(module_name, directory):
+    """Import <directory>/main.py as module_name, keeping its sibling modules private"""
+    path = os.path.join(ROOT, directory)
+    before = set(sys.modules)
+    sys.path.insert(0, path)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(path, 'main.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(path)
+        # Services can have same-named helper modules; don't let one service
+        # pick up the other's copy from the sys.modules cache
+        for name in set(sys.modules) - before - {module_name}:
+            module_file = getattr(sys.modules[name], '__file__', None) or ''
+            if os.path.dirname(os.path.abspath(module_file)) == path:
+                del sys.modules[name]
+    return module
+
+
+class FakeNewsAPI:
+    """Stands in for requests.get against NewsAPI top-headlines"""
+
+    def __init__(self, existing_urls, duplicate_rate=0.3, page_size=30, seed=0):
+        self.existing_urls = existing_urls
+        self.duplicate_rate = duplicate_rate
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+
+    def get(self, url, params=None, timeout=None):
+        category = (params or {}).get('category', 'general')
+        articles = []
+        for _ in range(self.page_size):
+            if self.existing_urls and self.rng.random() < self.duplicate_rate:
+                article_url = self.rng.choice(self.existing_urls)
+            else:
+                article_url = f"https://news.example.com/{category}/{self.rng.getrandbits(64):x}"
+            articles.append({
+                'title': headline(self.rng),
+                'description': summary(self.rng),
+                'url': article_url,
+                'urlToImage': f"https://img.example.com/{self.rng.getrandbits(32):x}.jpg",
+                'source': {'name': self.rng.choice(SOURCES)},
+                'author': 'Benchmark'
+            })
+        return SimpleNamespace(status_code=200, text='', json=lambda: {'articles': articles})
+
+
+def headline(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 10))).capitalize()
+
+
+def summary(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(15, 30))).capitalize() + '.'
+
+
+class Environment:
+    """news-service, user-service and engagement-function wired to shared fakes"""
+
+    def __init__(self, latency=None, firestore_emulator=None, state_dir=None):
+        self.latency = latency or Latency()
+        self.state_dir = state_dir or tempfile.mkdtemp(prefix='news-platform-bench-')
+        os.environ.setdefault('SEARCH_INDEX_PATH', os.path.join(self.state_dir, 'search_index.pkl'))
+        os.environ.setdefault('STALE_CACHE_DIR', os.path.join(self.state_dir, 'stale-cache'))
+        # Every simulated client shares one IP; measure the services, not the rate limiter
+        os.environ.setdefault('RATE_LIMITS', 'off')
+        # No per-instance Pub/Sub subscription: trending counts the events user-service publishes
+        os.environ.setdefault('TRENDING_SUBSCRIPTION_PREFIX', '')
+
+        firestore_emulator = firestore_emulator or os.environ.get('FIRESTORE_EMULATOR_HOST')
+        if firestore_emulator:
+            os.environ['FIRESTORE_EMULATOR_HOST'] = firestore_emulator
+            self.db = firestore.Client(project=os.environ.get('GOOGLE_CLOUD_PROJECT', 'benchmark'))
+        else:
+            self.db = FakeFirestoreClient(latency=self.latency)
+
+        self.bigquery = FakeBigQueryClient(latency=self.latency)
+        self.publisher = FakePublisherClient(latency=self.latency, subscribers=[self._deliver_engagement])
+        self.engagement = self._load_engagement_function()
+
+        with mock.patch.object(firestore, 'Client', return_value=self.db), \
+                mock.patch.object(pubsub_v1, 'PublisherClient', return_value=self.publisher):
+            self.news = load_service('news_service', 'news-service')
+            self.users = load_service('user_service', 'user-service')
+
+        # No real crawl and no politeness delay between categories
+        self.news_api = FakeNewsAPI(existing_urls=[])
+        self.news.requests = self.news_api
+        self.news.time = SimpleNamespace(**{name: getattr(time, name) for name in dir(time) if not name.startswith('_')})
+        self.news.time.sleep = lambda seconds: None
+
+        self.user_records = []
+        self.tokens = {}
+        self.article_ids = []
+
+    def _load_engagement_function(self):
+        """The Cloud Function is optional: it needs functions-framework and google-cloud-bigquery"""
+        try:
+            from google.cloud import bigquery
+            with mock.patch.object(bigquery, 'Client', return_value=self.bigquery):
+                return load_service('engagement_function', 'engagement-function')
+        except ImportError:
+            return None
+
+    def _deliver_engagement(self, topic, data, attributes):
+        if self.engagement is None:
+            return
+        cloud_event = SimpleNamespace(data={'message': {'data': base64.b64encode(data).decode()}})
+        self.engagement.process_engagement(cloud_event)
+
+    def seed(self, n_articles, n_users, seed=42):
+        """Write a synthetic corpus of articles, users and user_preferences"""
+        rng = random.Random(seed)
+        if isinstance(self.db, FakeFirestoreClient):
+            self.latency.enabled = False
+        try:
+            now = datetime.now(timezone.utc)
+            self.article_ids = [f"bench-article-{i:07d}" for i in range(n_articles)]
+            urls = []
+
+            batch, pending = self.db.batch(), 0
+            for article_id in self.article_ids:
+                category = rng.choice(CATEGORIES)
+                url = f"https://news.example.com/{category}/{article_id}"
+                urls.append(url)
+                batch.set(self.db.collection('articles').document(article_id), {
+                    'article_id': article_id,
+                    'title': headline(rng),
+                    'content': summary(rng),
+                    'category': category,
+                    'publish_date': now - timedelta(seconds=rng.randint(0, 30 * 86400)),
+                    'source': rng.choice(SOURCES),
+                    'image_url': f"https://img.example.com/{article_id}.jpg",
+                    'url': url,
+                    'author': 'Benchmark',
+                    'created_at': firestore.SERVER_TIMESTAMP
+                })
+                batch, pending = self._flush(batch, pending + 1)
+
+            # One hash for everyone: bcrypt cost belongs in the login benchmark, not the seeding
+            password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            self.user_records = []
+            for i in range(n_users):
+                user_id = f"bench-user-{i:07d}"
+                email = f"user{i}@bench.example.com"
+                username = f"user{i}"
+                interests = rng.sample(CATEGORIES, rng.randint(1, 3))
+                batch.set(self.db.collection('users').document(user_id), {
+                    'username': username,
+                    'email': email,
+                    'password': password_hash,
+                    'interests': interests,
+                    'created_at': firestore.SERVER_TIMESTAMP,
+                    'last_active': firestore.SERVER_TIMESTAMP
+                })
+                batch, pending = self._flush(batch, pending + 1)
+
+                if self.article_ids:
+                    liked = rng.sample(self.article_ids, min(len(self.article_ids), rng.randint(0, 10)))
+                    viewed = rng.sample(self.article_ids, min(len(self.article_ids), rng.randint(0, 30)))
+                    batch.set(self.db.collection('user_preferences').document(user_id), {
+                        'user_id': user_id,
+                        'liked_articles': liked,
+                        'shared_articles': liked[:2],
+                        'viewed_articles': viewed,
+                        'category_scores': {c: rng.randint(0, 30) for c in interests},
+                        'last_updated': firestore.SERVER_TIMESTAMP
+                    })
+                    batch, pending = self._flush(batch, pending + 1)
+
+                user = {'user_id': user_id, 'email': email, 'username': username}
+                self.user_records.append(user)
+                self.tokens[user_id] = self.token_for(user)
+
+            batch.commit()
+            self.news_api.existing_urls = urls
+        finally:
+            self.latency.enabled = True
+
+    def _flush(self, batch, pending):
+        if pending < SEED_BATCH_SIZE:
+            return batch, pending
+        batch.commit()
+        return self.db.batch(), 0
+
+    def token_for(self, user):
+        return self.users.generate_token(user['user_id'], user['email'], user['username'])
+
+
+def dump_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
@@ -0,0 +1,96 @@
+# benchmarks/loadtest_sse.py - Hold many idle /news/stream connections open
+#
+# Usage: python benchmarks/loadtest_sse.py --url http://localhost:8080/news/stream \
+#            --connections 5000 [--pid <gunicorn worker pid>] [--hold 30]
+#
+# Reports how many connections the server accepted, the server's memory per
+# connection (when --pid is given, from /proc/<pid>/status) and, for every
+# event published while the connections are held, how many clients got it.
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+
+def read_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def open_stream(host, port, path, stats, hold_until):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats['failed'] += 1
+        return
+
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+
+    try:
+        status = await asyncio.wait_for(reader.readline(), timeout=30)
+        if b' 200 ' not in status:
+            stats['failed'] += 1
+            return
+        stats['connected'] += 1
+
+        while time.monotonic() < hold_until:
+            line = await asyncio.wait_for(reader.readline(), timeout=max(0.1, hold_until - time.monotonic()))
+            if not line:
+                stats['dropped'] += 1
+                return
+            if line.startswith(b'id: '):
+                event_id = line[4:].strip().decode()
+                stats['events'][event_id] = stats['events'].get(event_id, 0) + 1
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    path = url.path + (f"?{url.query}" if url.query else '')
+
+    stats = {'connected': 0, 'failed': 0, 'dropped': 0, 'events': {}}
+    rss_before = read_rss_kb(args.pid) if args.pid else None
+
+    start = time.monotonic()
+    hold_until = start + args.ramp + args.hold
+    tasks = []
+    for i in range(args.connections):
+        tasks.append(asyncio.create_task(open_stream(host, port, path, stats, hold_until)))
+        # Spread connection setup over the ramp period
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.connections)
+
+    await asyncio.sleep(max(0, start + args.ramp + 2 - time.monotonic()))
+    print(f"connected: {stats['connected']:,}  failed: {stats['failed']:,}  "
+          f"(ramp {time.monotonic() - start:.1f}s)")
+
+    if args.pid:
+        rss_after = read_rss_kb(args.pid)
+        per_connection = (rss_after - rss_before) * 1024 / max(1, stats['connected'])
+        print(f"server rss: {rss_before / 1024:,.1f} MB -> {rss_after / 1024:,.1f} MB "
+              f"({per_connection / 1024:,.1f} KB per connection)")
+
+    await asyncio.gather(*tasks)
+    print(f"dropped: {stats['dropped']:,}")
+    # Ids are '<epoch>-<sequence number>'
+    for event_id, received in sorted(stats['events'].items(), key=lambda item: int(item[0].rpartition('-')[2])):
+        print(f"event {event_id}: delivered to {received:,} clients")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://localhost:8080/news/stream')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--ramp', type=float, default=10, help="seconds to spread connection setup over")
+    parser.add_argument('--hold', type=float, default=30, help="seconds to hold connections open")
+    parser.add_argument('--pid', type=int, help="server process to measure memory of")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,208 @@
+# benchmarks/run_load.py - Concurrent load against the services with fake GCP backends
+#
+# Usage:
+#   python benchmarks/run_load.py --articles 10000 --users 10000 --concurrency 16 \
+#       --duration 20 --read-latency-ms 5 --query-latency-ms 20 --write-latency-ms 10 \
+#       --output benchmarks/results/run.json [--baseline benchmarks/results/previous.json]
+#
+# Each scenario runs in its own phase; the JSON report has throughput and
+# latency percentiles per scenario so runs can be compared over time.
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import subprocess
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import Latency  # noqa: E402
+from harness import Environment, CATEGORIES, PASSWORD, ROOT, dump_json  # noqa: E402
+
+EVENT_TYPES = ['view', 'view', 'view', 'like', 'share']
+
+
+def scenario_news(env, client, rng):
+    category = rng.choice(CATEGORIES + ['all'])
+    return client.get(f"/news?category={category}&limit=30")
+
+
+def scenario_fetch(env, client, rng):
+    return client.post('/news/fetch')
+
+
+def scenario_login(env, client, rng):
+    user = rng.choice(env.user_records)
+    return client.post('/auth/login', json={'email': user['email'], 'password': PASSWORD})
+
+
+def scenario_engagement(env, client, rng):
+    user = rng.choice(env.user_records)
+    return client.post('/engagement', headers={'Authorization': f"Bearer {env.tokens[user['user_id']]}"}, json={
+        'article_id': rng.choice(env.article_ids),
+        'event_type': rng.choice(EVENT_TYPES),
+        'device_type': 'benchmark'
+    })
+
+
+def scenario_recommendations(env, client, rng):
+    user = rng.choice(env.user_records)
+    return client.get('/users/me/recommendations',
+                      headers={'Authorization': f"Bearer {env.tokens[user['user_id']]}"})
+
+
+# scenario -> (service attribute on Environment, request function)
+SCENARIOS = {
+    'news': ('news', scenario_news),
+    'fetch': ('news', scenario_fetch),
+    'login': ('users', scenario_login),
+    'engagement': ('users', scenario_engagement),
+    'recommendations': ('users', scenario_recommendations),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(env, name, concurrency, duration, max_requests):
+    service, request_fn = SCENARIOS[name]
+    app = getattr(env, service).app
+    latencies = []
+    errors = [0]
+    issued = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        client = app.test_client()
+        local = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    break
+                issued[0] += 1
+            start = time.perf_counter()
+            response = request_fn(env, client, rng)
+            local.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None
+        }
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline):
+    """Print throughput and p50/p95 changes against a previous report"""
+    print(f"\nCompared with {baseline.get('git_commit')} ({baseline.get('created_at')}):")
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        line = [f"  {name:16}"]
+        for label, now, before in (
+            ('rps', result['throughput_rps'], previous['throughput_rps']),
+            ('p50', result['latency_ms']['p50'], previous['latency_ms']['p50']),
+            ('p95', result['latency_ms']['p95'], previous['latency_ms']['p95']),
+        ):
+            if now is None or not before:
+                continue
+            line.append(f"{label} {before:,.1f} -> {now:,.1f} ({(now - before) / before:+.1%})")
+        print('  '.join(line))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--scenarios', nargs='+', default=['news', 'login', 'engagement', 'recommendations', 'fetch'],
+                        choices=sorted(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help="seconds per scenario")
+    parser.add_argument('--max-requests', type=int, default=0, help="per scenario, 0 for no limit")
+    parser.add_argument('--read-latency-ms', type=float, default=0)
+    parser.add_argument('--query-latency-ms', type=float, default=0)
+    parser.add_argument('--write-latency-ms', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0.25)
+    parser.add_argument('--firestore-emulator', help="host:port of a Firestore emulator to use instead of the fake")
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results',
+                                                         f"load-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    parser.add_argument('--baseline', help="previous report to compare against")
+    parser.add_argument('--verbose', action='store_true', help="keep the services' INFO logging")
+    args = parser.parse_args()
+
+    latency = Latency(read_ms=args.read_latency_ms, write_ms=args.write_latency_ms,
+                      query_ms=args.query_latency_ms, jitter=args.jitter)
+    env = Environment(latency=latency, firestore_emulator=args.firestore_emulator)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    env.seed(args.articles, args.users)
+    print(f"Seeded {args.articles:,} articles and {args.users:,} users in {time.perf_counter() - start:.1f}s")
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'verbose')},
+        'results': {}
+    }
+
+    for name in args.scenarios:
+        result = run_scenario(env, name, args.concurrency, args.duration, args.max_requests)
+        report['results'][name] = result
+        latency_ms = result['latency_ms']
+        print(f"{name:16} {result['requests']:>7,} req  {result['errors']:>5,} err  "
+              f"{result['throughput_rps']:>9,.1f} req/s  p50 {latency_ms['p50'] or 0:8.2f} ms  "
+              f"p95 {latency_ms['p95'] or 0:8.2f} ms  p99 {latency_ms['p99'] or 0:8.2f} ms")
+
+    dump_json(args.output, report)
+    print(f"\nReport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
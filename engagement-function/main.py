@@ -1,4 +1,5 @@
 # engagement-function/main.py - FIXED FOR BIGQUERY
+import os
 import base64
 import json
 import logging
@@ -12,7 +13,7 @@ logger = logging.getLogger(__name__)
 
 # Initialize BigQuery client
 client = bigquery.Client()
-table_id = "news-platform-474717.news_platform_new.user_engagement"
+table_id = os.environ.get('BIGQUERY_TABLE', "news-platform-474717.news_platform_new.user_engagement")
 
 @functions_framework.cloud_event
 def process_engagement(cloud_event):
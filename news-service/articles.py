@@ -0,0 +1,203 @@
+# articles.py - Slotted article model and cached JSON feed encoding
+#
+# Shared by news-service and user-service; the two copies are identical.
+import uuid
+import decimal
+import threading
+from datetime import date
+
+import orjson
+from flask import Response
+from werkzeug.http import http_date
+
+# Fields written by news-service store_articles(); anything else a document
+# holds is kept in Article.other
+ARTICLE_FIELDS = ('article_id', 'title', 'content', 'category', 'publish_date', 'source',
+                  'image_url', 'url', 'author', 'created_at')
+_ARTICLE_FIELD_SET = frozenset(ARTICLE_FIELDS)
+_MISSING = object()
+# Articles kept in the stale cache are encoded by several threads; only one
+# copies in a snapshot's fields, and the others see _pending cleared only
+# once every field is set
+_load_lock = threading.Lock()
+
+# Same wire format as Flask's jsonify: sorted keys, datetimes as HTTP dates
+_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+
+
+def _default(value):
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value):
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+class Article:
+    """An article document as served by the feed endpoints.
+
+    Fields missing from the document are left unset and omitted from the
+    JSON. version is the document's update time; per-request values such as
+    recommendation_score go in annotations and are never cached.
+    """
+
+    __slots__ = ARTICLE_FIELDS + ('version', 'other', 'annotations', '_pending')
+
+    def __init__(self, version=None, **fields):
+        self.version = version
+        self.other = None
+        self.annotations = None
+        self._pending = None
+        for name, value in fields.items():
+            self.set_field(name, value)
+
+    @classmethod
+    def from_snapshot(cls, doc, placeholder_image=None):
+        """Article from a Firestore document snapshot.
+
+        Only the ID and version are read up front. to_dict() deep-copies the
+        whole document, so it is called the first time any other field is
+        needed; a feed assembled from cached fragments never needs one.
+        """
+        article = cls(version=doc.update_time)
+        article.article_id = doc.id
+        article._pending = (doc, placeholder_image)
+        return article
+
+    def _load(self):
+        """Copy in the fields of the snapshot this article was made from"""
+        with _load_lock:
+            if self._pending is None:
+                return
+            doc, placeholder_image = self._pending
+            data = doc.to_dict() or {}
+            for name, value in data.items():
+                self.set_field(name, value)
+            if placeholder_image and not data.get('image_url'):
+                self.image_url = placeholder_image
+            self._pending = None
+
+    def __getattr__(self, name):
+        # Only reached for unset fields
+        if name in _ARTICLE_FIELD_SET and self._pending is not None:
+            self._load()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def set_field(self, name, value):
+        if name in _ARTICLE_FIELD_SET:
+            setattr(self, name, value)
+        else:
+            if self.other is None:
+                self.other = {}
+            self.other[name] = value
+
+    def get(self, name, default=None):
+        """Field, extra document field or annotation by name"""
+        if self._pending is not None:
+            self._load()
+        if name in _ARTICLE_FIELD_SET:
+            return getattr(self, name, default)
+        if self.annotations and name in self.annotations:
+            return self.annotations[name]
+        return self.other.get(name, default) if self.other else default
+
+    def annotate(self, **values):
+        if self.annotations is None:
+            self.annotations = {}
+        self.annotations.update(values)
+
+    def stored_fields(self):
+        """The document's fields as a dict, without annotations"""
+        if self._pending is not None:
+            self._load()
+        fields = {}
+        for name in ARTICLE_FIELDS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                fields[name] = value
+        if self.other:
+            fields.update(self.other)
+        return fields
+
+    def to_dict(self):
+        fields = self.stored_fields()
+        if self.annotations:
+            fields.update(self.annotations)
+        return fields
+
+
+class FeedEncoder:
+    """Encodes feed payloads to JSON, reusing each article's encoded bytes.
+
+    The bytes for an article's stored fields are cached by article ID and
+    version, so an unchanged article is encoded once and later feeds are
+    assembled by joining cached fragments. Annotations are encoded per
+    request and spliced into the fragment. Payloads may mix Articles and
+    plain dicts (e.g. a stale feed read back from disk).
+    """
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._fragments = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def article_bytes(self, article):
+        cached = self._fragments.get(article.article_id)
+        if cached is not None and article.version is not None and cached[0] == article.version:
+            self.hits += 1
+            fragment = cached[1]
+        else:
+            self.misses += 1
+            fragment = _dumps(article.stored_fields())
+            if article.version is not None:
+                with self._lock:
+                    if len(self._fragments) >= self.max_entries and article.article_id not in self._fragments:
+                        # Oldest insertion first; updated articles are re-inserted at the end
+                        del self._fragments[next(iter(self._fragments))]
+                    self._fragments.pop(article.article_id, None)
+                    self._fragments[article.article_id] = (article.version, fragment)
+
+        return self.extend(fragment, article.annotations)
+
+    @staticmethod
+    def extend(body, values):
+        """JSON object bytes with the keys of values added"""
+        if not values:
+            return body
+        if body == b'{}':
+            return _dumps(values)
+        # '{...}' + '{"a":1}' -> '{...,"a":1}'
+        return body[:-1] + b',' + _dumps(values)[1:]
+
+    def _value_bytes(self, value):
+        if isinstance(value, Article):
+            return self.article_bytes(value)
+        if isinstance(value, list):
+            return b'[' + b','.join(self._value_bytes(item) for item in value) + b']'
+        if isinstance(value, dict):
+            return self.encode(value)
+        return _dumps(value)
+
+    def encode(self, payload):
+        """JSON bytes for a dict payload whose lists (at any depth) may hold Articles"""
+        return b'{' + b','.join(
+            _dumps(key) + b':' + self._value_bytes(value) for key, value in sorted(payload.items())
+        ) + b'}'
+
+    def dumps(self, payload):
+        return self.encode(payload).decode('utf-8')
+
+    def response(self, payload):
+        """JSON response for a dict payload, or for bytes it has already encoded"""
+        body = payload if isinstance(payload, bytes) else self.encode(payload)
+        return Response(body, mimetype='application/json')
+
+    def stats(self):
+        return {'entries': len(self._fragments), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,79 @@
+# news-service/broadcaster.py - Fan-out of new-article events to streaming clients
+import json
+import uuid
+import threading
+from collections import deque
+
+
+class Broadcaster:
+    """Publishes events to any number of waiting subscribers.
+
+    Events are kept in a bounded history with increasing ids. Subscribers do
+    not get their own queue; each one remembers the last id it has sent and
+    waits on a shared condition, so an idle connection costs one waiter and
+    reconnecting clients can resume with Last-Event-ID. Each event is encoded
+    once, however many clients receive it.
+
+    Ids sent to clients are prefixed with a random epoch, so an id issued by
+    another instance or an earlier process is recognised and never mistaken
+    for a position in this one's history.
+    """
+
+    def __init__(self, history=1000):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self.subscribers = 0
+        self.epoch = uuid.uuid4().hex[:8]
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def format_id(self, event_id):
+        """Event id as sent to clients"""
+        return f"{self.epoch}-{event_id}"
+
+    def resume_after(self, last_event_id):
+        """The event id to resume after for a client's Last-Event-ID.
+
+        Ids from another epoch, malformed ids and ids ahead of this history
+        start from now.
+        """
+        epoch, _, number = (last_event_id or '').rpartition('-')
+        if epoch == self.epoch and number.isdigit() and int(number) <= self._last_id:
+            return int(number)
+        return self._last_id
+
+    def publish(self, event_type, data, category=None):
+        """Add an event and wake every waiting subscriber"""
+        payload = json.dumps(data, default=str, separators=(',', ':'))
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, category, payload))
+            self._cond.notify_all()
+        return self._last_id
+
+    def wait_for_events(self, after_id, timeout):
+        """Return events newer than after_id, waiting up to timeout seconds for one"""
+        with self._cond:
+            if self._last_id <= after_id:
+                self._cond.wait(timeout)
+            if self._last_id <= after_id:
+                return []
+            # History is ordered by id, so scan back only as far as needed
+            newer = []
+            for event in reversed(self._events):
+                if event[0] <= after_id:
+                    break
+                newer.append(event)
+            newer.reverse()
+            return newer
+
+    def subscribe(self):
+        with self._cond:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
@@ -1,12 +1,28 @@
 import os
 import requests
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from google.cloud import firestore
 import logging
 from datetime import datetime, timedelta
 import uuid
 import time
+import threading
+from search_index import InvertedIndex
+from broadcaster import Broadcaster
+from resilience import CircuitBreaker, CircuitOpenError, StaleCache
+from articles import Article, FeedEncoder
+from rate_limit import RateLimiter, load_quotas, open_backend
+
+# /news/stream holds connections open, so gunicorn runs gevent workers; make
+# grpc (Firestore) cooperate with them
+try:
+    from gevent import monkey
+    if monkey.is_module_patched('socket'):
+        import grpc.experimental.gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+except ImportError:
+    pass
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -16,20 +32,241 @@ logging.basicConfig(level=logging.INFO)
 db = firestore.Client()
 
 # News API key
-NEWS_API_KEY = 'ae5d578c6235410d864d5be2af511cce'
+NEWS_API_KEY = os.environ.get('NEWS_API_KEY', 'ae5d578c6235410d864d5be2af511cce')
+
+# Categories fetched from NewsAPI
+CATEGORIES = ['technology', 'business', 'sports', 'entertainment', 'science']
+
+# /news page size when the request doesn't give one. Only feeds of this size
+# for a known category (or all) are kept as stale fallbacks, so query strings
+# can't fill the cache or its directory.
+DEFAULT_NEWS_LIMIT = 30
 
 # Placeholder image URL for missing or blocked images
 PLACEHOLDER_IMAGE = 'https://placehold.co/400x200/3b82f6/ffffff/png?text=News'
 
+# Search index snapshot (local path, optionally mirrored to a GCS bucket)
+SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH', '/tmp/search_index.pkl')
+SEARCH_INDEX_BUCKET = os.environ.get('SEARCH_INDEX_BUCKET', '')
+SEARCH_INDEX_BLOB = 'search/search_index.pkl'
+MAX_SEARCH_RESULTS = 50
+# Catch up with articles stored by other instances at most this often. Each
+# catch-up re-reads a margin before the watermark, for articles whose
+# publish_date was set a little before they were written.
+SEARCH_INDEX_SYNC_SECONDS = int(os.environ.get('SEARCH_INDEX_SYNC_SECONDS', 60))
+SEARCH_INDEX_SYNC_OVERLAP = timedelta(minutes=5)
+search_sync_lock = threading.Lock()
+last_search_sync = 0.0
+
+# Server-Sent Events feed of newly stored articles
+SSE_HEARTBEAT_SECONDS = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+SSE_RETRY_MS = 5000
+broadcaster = Broadcaster(history=int(os.environ.get('SSE_HISTORY', 1000)))
+# Each instance watches this many of the newest articles and broadcasts the
+# ones added, so its clients see articles stored by any instance
+SSE_LISTENER_WINDOW = 200
+article_listener_ready = False
+
+# Firestore circuit breaker and last-known-good feeds, served with
+# "stale": true while the breaker is open or a query fails
+FIRESTORE_TIMEOUT_SECONDS = float(os.environ.get('FIRESTORE_TIMEOUT_SECONDS', 5))
+firestore_breaker = CircuitBreaker(
+    'firestore',
+    slow_call_seconds=float(os.environ.get('FIRESTORE_SLOW_CALL_SECONDS', 2)),
+    open_seconds=float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+)
+# Feed responses are assembled from per-article JSON cached by ID and version
+feed_encoder = FeedEncoder()
+stale_cache = StaleCache(os.environ.get('STALE_CACHE_DIR', '/tmp/stale-cache/news-service'), dumps=feed_encoder.dumps)
+
+# Rate limits per route and client IP ("limit/seconds"), overridable with a
+# RATE_LIMITS JSON object; RATE_LIMIT_REDIS_URL shares counters across instances.
+# /news/fetch starts a full NewsAPI crawl, so all callers share its quota.
+RATE_LIMIT_DEFAULTS = {
+    '/news/fetch': '2/300',
+    '/news/search': '60/60'
+}
+rate_limiter = RateLimiter(
+    app,
+    load_quotas(os.environ.get('RATE_LIMITS', ''), RATE_LIMIT_DEFAULTS),
+    backend=open_backend(os.environ.get('RATE_LIMIT_REDIS_URL')),
+    shared_routes=('/news/fetch',)
+)
+
+# Progress of retention-job runs. Once a run completes, the articles it
+# archived are dropped from the search index.
+retention_state_ref = db.collection('retention_state').document('articles')
+# Compact the search index once this share of its documents has been removed
+SEARCH_INDEX_COMPACT_FRACTION = 0.2
+
+#######################################
+# Search Index
+#######################################
+
+def load_search_index():
+    """Restore the search index from its latest snapshot, or start empty"""
+    if SEARCH_INDEX_BUCKET and not os.path.exists(SEARCH_INDEX_PATH):
+        try:
+            from google.cloud import storage
+            blob = storage.Client().bucket(SEARCH_INDEX_BUCKET).blob(SEARCH_INDEX_BLOB)
+            if blob.exists():
+                blob.download_to_filename(SEARCH_INDEX_PATH)
+                logging.info(f"Downloaded search index snapshot from gs://{SEARCH_INDEX_BUCKET}/{SEARCH_INDEX_BLOB}")
+        except Exception as e:
+            logging.error(f"Error downloading search index snapshot: {str(e)}")
+
+    index = InvertedIndex.load(SEARCH_INDEX_PATH)
+    if index is None:
+        logging.info("No search index snapshot - starting with an empty index")
+        return InvertedIndex()
+
+    logging.info(f"Restored search index: {index.stats()}")
+    return index
+
+def save_search_index():
+    """Snapshot the search index to disk (and GCS if configured).
+
+    Only called right after a catch-up, so the snapshot holds every article
+    up to its watermark whichever instance wrote it last.
+    """
+    try:
+        search_index.save(SEARCH_INDEX_PATH)
+        if SEARCH_INDEX_BUCKET:
+            from google.cloud import storage
+            blob = storage.Client().bucket(SEARCH_INDEX_BUCKET).blob(SEARCH_INDEX_BLOB)
+            blob.upload_from_filename(SEARCH_INDEX_PATH)
+        logging.info(f"Saved search index snapshot: {search_index.stats()}")
+    except Exception as e:
+        logging.error(f"Error saving search index snapshot: {str(e)}")
+
+def sync_search_index(save=False):
+    """Index articles published since the watermark, then move the watermark to the newest one"""
+    global last_search_sync
+    # A catch-up already running will do, unless this one has to save
+    if not search_sync_lock.acquire(blocking=save):
+        return
+    try:
+        query = db.collection('articles')
+        if search_index.watermark is not None:
+            query = query.where('publish_date', '>', search_index.watermark - SEARCH_INDEX_SYNC_OVERLAP)
+        query = query.order_by('publish_date')
+
+        added = 0
+        newest = None
+        for doc in query.stream():
+            article_data = doc.to_dict()
+            if 'article_id' not in article_data:
+                article_data['article_id'] = doc.id
+            if search_index.add_article(article_data):
+                added += 1
+            newest = article_data.get('publish_date') or newest
+
+        # Only a complete pass moves the watermark
+        if newest is not None:
+            search_index.advance_watermark(newest)
+        apply_retention()
+        last_search_sync = time.time()
+        if added:
+            logging.info(f"Search index caught up: {added} articles added")
+        if save and newest is not None:
+            save_search_index()
+    except Exception as e:
+        logging.error(f"Error syncing search index: {str(e)}")
+    finally:
+        search_sync_lock.release()
+
+def apply_retention():
+    """Drop articles archived by the latest completed retention run"""
+    state = retention_state_ref.get()
+    state = state.to_dict() if state.exists else {}
+    if state.get('status') != 'completed' or state.get('run_id') == search_index.retention_run_id:
+        return
+    removed = search_index.remove_expired(state['cutoffs'])
+    search_index.retention_run_id = state['run_id']
+    if search_index.removed_fraction() > SEARCH_INDEX_COMPACT_FRACTION:
+        search_index.compact()
+    logging.info(f"Applied retention run {state['run_id']} to the search index: {removed} articles removed")
+
+search_index = load_search_index()
+threading.Thread(target=sync_search_index, daemon=True).start()
+
+#######################################
+# Article Events
+#######################################
+
+def article_event(article_data):
+    """Payload of an 'article' stream event"""
+    publish_date = article_data.get('publish_date')
+    return {
+        'article_id': article_data.get('article_id'),
+        'title': article_data.get('title'),
+        'category': article_data.get('category'),
+        'source': article_data.get('source'),
+        'image_url': article_data.get('image_url'),
+        'url': article_data.get('url'),
+        'publish_date': publish_date.isoformat() if publish_date else None
+    }
+
+def on_articles_snapshot(docs, changes, read_time):
+    """Broadcast articles newly stored by any instance, then a count per category"""
+    global article_listener_ready
+    if not article_listener_ready:
+        # The first snapshot holds the articles that were already there
+        article_listener_ready = True
+        return
+    
+    counts = {}
+    for change in changes:
+        if change.type.name != 'ADDED':
+            continue
+        article_data = change.document.to_dict()
+        category = article_data.get('category')
+        broadcaster.publish('article', article_event(article_data), category=category)
+        counts[category] = counts.get(category, 0) + 1
+    
+    for category, stored in counts.items():
+        broadcaster.publish('category', {
+            'category': category,
+            'new_articles': stored
+        }, category=category)
+
+def open_article_listener():
+    """Watch the newest articles for this instance's stream clients. None on failure."""
+    try:
+        query = db.collection('articles')\
+            .order_by('publish_date', direction=firestore.Query.DESCENDING)\
+            .limit(SSE_LISTENER_WINDOW)
+        return query.on_snapshot(on_articles_snapshot)
+    except Exception as e:
+        logging.warning(f"Could not watch articles, streaming only the ones stored here: {str(e)}")
+        return None
+
+article_listener = open_article_listener()
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "service": "news-service"}), 200
+    return jsonify({
+        "status": "healthy",
+        "service": "news-service",
+        "circuits": [firestore_breaker.snapshot()]
+    }), 200
+
+def stale_response(cache_key, fallback, error=None):
+    """Last good payload for cache_key flagged as stale, or fallback if there is none"""
+    payload, age = stale_cache.get(cache_key) if cache_key else (None, None)
+    if payload is None:
+        return jsonify(fallback), 200
+    
+    response = dict(payload, stale=True, stale_age_seconds=round(age, 1))
+    if error:
+        response['error'] = error
+    return feed_encoder.response(response), 200
 
 @app.route('/news/fetch', methods=['POST'])
 def fetch_news():
     """Fetch news from NewsAPI and store in Firestore"""
     try:
-        categories = ['technology', 'business', 'sports', 'entertainment', 'science']
+        categories = CATEGORIES
         
         articles_stored = 0
         articles_attempted = 0
@@ -54,6 +291,11 @@ def fetch_news():
                     logging.info(f"Received {len(articles)} articles for {category}")
                     
                     stored = store_articles(articles, category)
+                    if stored and article_listener is None:
+                        broadcaster.publish('category', {
+                            'category': category,
+                            'new_articles': stored
+                        }, category=category)
                     articles_stored += stored
                     articles_attempted += len(articles)
                     
@@ -66,6 +308,10 @@ def fetch_news():
             except Exception as e:
                 logging.error(f"Error fetching {category}: {str(e)}")
         
+        if articles_stored:
+            # Catch up first so the uploaded snapshot is complete to its watermark
+            sync_search_index(save=True)
+        
         return jsonify({
             "message": f"Successfully stored {articles_stored} articles",
             "articles_stored": articles_stored,
@@ -129,6 +375,13 @@ def store_articles(articles, category):
             db.collection('articles').document(article_id).set(article_data)
             stored_count += 1
             
+            # Searchable here right away; other instances pick it up on their next catch-up
+            search_index.add_article(article_data)
+            
+            # Notify streaming clients; with a listener every instance hears of it from Firestore
+            if article_listener is None:
+                broadcaster.publish('article', article_event(article_data), category=article_data['category'])
+            
             logging.info(f"Stored: [{category}] {title[:50]}")
             
         except Exception as e:
@@ -140,12 +393,16 @@ def store_articles(articles, category):
 @app.route('/news', methods=['GET'])
 def get_news():
     """Get news articles with optional category filter"""
+    cache_key = None
     try:
         category = request.args.get('category', '').lower()
-        limit = int(request.args.get('limit', 30))
+        limit = int(request.args.get('limit', DEFAULT_NEWS_LIMIT))
         
         logging.info(f"GET /news - category: '{category}', limit: {limit}")
         
+        if limit == DEFAULT_NEWS_LIMIT and (category in CATEGORIES or category in ('', 'all')):
+            cache_key = f"news-{category or 'all'}"
+        
         # Build query
         articles_ref = db.collection('articles')
         
@@ -160,50 +417,149 @@ def get_news():
         # Order by publish date and limit
         query = query.order_by('publish_date', direction=firestore.Query.DESCENDING).limit(limit)
         
-        # Execute query
-        articles_stream = query.stream()
-        articles_list = list(articles_stream)
+        # Execute query (fails fast while the breaker is open)
+        articles_list = firestore_breaker.call(query.get, timeout=FIRESTORE_TIMEOUT_SECONDS)
         
         logging.info(f"Query returned {len(articles_list)} articles")
         
-        # Convert to dictionary
-        result = []
-        for doc in articles_list:
-            article_data = doc.to_dict()
-            
-            # Ensure article_id is present
-            if 'article_id' not in article_data:
-                article_data['article_id'] = doc.id
-            
-            # Ensure image_url has fallback
-            image_url = article_data.get('image_url', '')
-            if not image_url:
-                article_data['image_url'] = PLACEHOLDER_IMAGE
-            
-            result.append(article_data)
+        # Convert to articles, with the placeholder for a missing image_url
+        result = [Article.from_snapshot(doc, PLACEHOLDER_IMAGE) for doc in articles_list]
         
         logging.info(f"Returning {len(result)} articles")
         
-        return jsonify({
+        response = {
             "articles": result,
             "count": len(result),
             "category": category if category else "all"
-        }), 200
+        }
+        if cache_key:
+            stale_cache.put(cache_key, response, persist=True)
         
+        return feed_encoder.response(dict(response, stale=False)), 200
+        
+    except CircuitOpenError as e:
+        return stale_response(cache_key, {
+            "articles": [],
+            "count": 0,
+            "error": "Firestore unavailable"
+        }, error=str(e))
     except Exception as e:
         logging.error(f"Error in get_news: {str(e)}", exc_info=True)
-        # Return empty array instead of error to prevent frontend crash
-        return jsonify({
+        # Return the last good feed, or an empty array to prevent frontend crash
+        fallback = {
             "articles": [],
             "count": 0,
             "error": str(e)
+        }
+        if cache_key:
+            return stale_response(cache_key, fallback, error=str(e))
+        return jsonify(fallback), 200
+
+@app.route('/news/stream', methods=['GET'])
+def stream_news():
+    """Server-Sent Events feed of new articles and per-category counts"""
+    category = request.args.get('category', '').lower()
+    if category == 'all':
+        category = ''
+    
+    # Resume after the last event the client saw on this instance, otherwise start from now
+    last_id = broadcaster.resume_after(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    def generate(last_id):
+        broadcaster.subscribe()
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                events = broadcaster.wait_for_events(last_id, SSE_HEARTBEAT_SECONDS)
+                if not events:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                for event_id, event_type, event_category, payload in events:
+                    last_id = event_id
+                    if category and event_category != category:
+                        continue
+                    yield f"id: {broadcaster.format_id(event_id)}\nevent: {event_type}\ndata: {payload}\n\n"
+        finally:
+            broadcaster.unsubscribe()
+    
+    return Response(stream_with_context(generate(last_id)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/news/stream/stats', methods=['GET'])
+def stream_stats():
+    """Connected stream clients on this instance"""
+    return jsonify({
+        "subscribers": broadcaster.subscribers,
+        "last_event_id": broadcaster.format_id(broadcaster.last_id)
+    }), 200
+
+@app.route('/news/search', methods=['GET'])
+def search_news():
+    """Full-text search over article title, content and source"""
+    try:
+        query_text = request.args.get('q', '').strip()
+        if not query_text:
+            return jsonify({"error": "Missing query parameter: q"}), 400
+        
+        category = request.args.get('category', '').lower()
+        if category == 'all':
+            category = ''
+        limit = min(int(request.args.get('limit', 10)), MAX_SEARCH_RESULTS)
+        
+        # Run on requests rather than a timer: Cloud Run throttles the CPU between them
+        if time.time() - last_search_sync > SEARCH_INDEX_SYNC_SECONDS:
+            threading.Thread(target=sync_search_index, daemon=True).start()
+        
+        hits = search_index.search(query_text, k=limit, category=category or None)
+        logging.info(f"GET /news/search - q: '{query_text}', category: '{category}', hits: {len(hits)}")
+        
+        # Load the matching documents in one round trip, keeping rank order
+        articles_by_id = {}
+        if hits:
+            refs = [db.collection('articles').document(article_id) for article_id, _ in hits]
+            for doc in db.get_all(refs):
+                if doc.exists:
+                    articles_by_id[doc.id] = Article.from_snapshot(doc, PLACEHOLDER_IMAGE)
+        
+        result = []
+        for article_id, score in hits:
+            article = articles_by_id.get(article_id)
+            if article is None:
+                continue
+            article.annotate(search_score=round(score, 4))
+            result.append(article)
+        
+        return feed_encoder.response({
+            "articles": result,
+            "count": len(result),
+            "query": query_text,
+            "category": category if category else "all"
         }), 200
+        
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    except Exception as e:
+        logging.error(f"Error in search_news: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/news/retention/status', methods=['GET'])
+def retention_status():
+    """Progress of the current or last retention run"""
+    try:
+        state = retention_state_ref.get()
+        return jsonify(state.to_dict() if state.exists else {'status': 'never_run'}), 200
+    except Exception as e:
+        logging.error(f"Error getting retention status: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/news/count', methods=['GET'])
 def count_articles():
     """Get count of articles by category"""
     try:
-        categories = ['technology', 'business', 'sports', 'entertainment', 'science']
+        categories = CATEGORIES
         counts = {}
         
         for category in categories:
@@ -0,0 +1,227 @@
+# rate_limit.py - Sliding-window rate limiting middleware
+#
+# Shared by news-service and user-service; the two copies are identical.
+import os
+import json
+import math
+import time
+import logging
+import threading
+
+from flask import request, jsonify
+
+from resilience import CircuitBreaker, CircuitOpenError
+
+# Cloud Run appends the caller's address to X-Forwarded-For; entries before
+# the last TRUSTED_PROXY_HOPS were supplied by the client and can be forged
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+
+
+class Quota:
+    """At most `limit` requests per `window` seconds"""
+
+    __slots__ = ('limit', 'window')
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse "120/60" as 120 requests per 60 seconds"""
+        limit, _, window = str(spec).partition('/')
+        return cls(int(limit), float(window or 60))
+
+    def __repr__(self):
+        return f"{self.limit}/{self.window:g}s"
+
+
+def load_quotas(raw, defaults):
+    """defaults updated with a JSON {route: "limit/seconds"} override.
+
+    "off" as a route's quota disables limiting for it; raw "off" disables it everywhere.
+    """
+    if raw == 'off':
+        return {}
+    quotas = {route: Quota.parse(spec) for route, spec in defaults.items()}
+    if raw:
+        for route, spec in json.loads(raw).items():
+            if spec in (None, 'off', ''):
+                quotas.pop(route, None)
+            else:
+                quotas[route] = Quota.parse(spec)
+    return quotas
+
+
+def retry_after(quota, elapsed, current, previous):
+    """Seconds until one more request fits in the sliding window"""
+    window = quota.window
+    if current >= quota.limit:
+        # Wait for the next window, then for enough of this window's count
+        # to slide out that the retry itself fits
+        wait = (window - elapsed) + window * (1 - quota.limit / max(current, 1)) + window / max(quota.limit, 1)
+    else:
+        # Wait for enough of the previous window's count to slide out to
+        # leave room for the retry
+        wait = window * (1 - (quota.limit - current - 1) / previous) - elapsed
+    return max(1, math.ceil(wait))
+
+
+class MemoryBackend:
+    """Sliding-window counters held in this process.
+
+    Each key keeps the counts of the current and previous fixed windows. The
+    estimated count is previous * (share of the previous window still inside
+    the sliding window) + current. Expired keys are swept as the table grows;
+    past max_keys the oldest keys are dropped (their clients start afresh).
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._sweep_at = 1024
+
+    def hit(self, key, quota, now):
+        """(allowed, retry_after_seconds); a rejected request is not counted"""
+        window_index, elapsed = divmod(now, quota.window)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                if len(self._counters) >= self._sweep_at:
+                    self._sweep(now)
+                counter = self._counters[key] = [window_index, 0, 0, 0.0]
+            elif counter[0] != window_index:
+                # Roll forward: the current window becomes the previous one,
+                # or both are empty if more than a window has passed
+                counter[2] = counter[1] if window_index - counter[0] == 1 else 0
+                counter[1] = 0
+                counter[0] = window_index
+            current, previous = counter[1], counter[2]
+            if previous * (1 - elapsed / quota.window) + current + 1 > quota.limit:
+                return False, retry_after(quota, elapsed, current, previous)
+            counter[1] = current + 1
+            counter[3] = (window_index + 2) * quota.window
+        return True, 0
+
+    def _sweep(self, now):
+        self._counters = {key: counter for key, counter in self._counters.items() if counter[3] > now}
+        overflow = len(self._counters) - self.max_keys + 1
+        if overflow > 0:
+            logging.warning(f"Rate limiter holds over {self.max_keys} keys; dropping the oldest {overflow}")
+            for key in list(self._counters)[:overflow]:
+                del self._counters[key]
+        self._sweep_at = max(1024, 2 * len(self._counters))
+
+
+# Check and increment in one round trip; KEYS = current, previous window
+_REDIS_HIT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[1]) + current + 1 > tonumber(ARGV[2]) then
+    return {0, current, previous}
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {1, current + 1, previous}
+"""
+
+
+class RedisBackend:
+    """Sliding-window counters in Redis (or a compatible server), shared by all instances.
+
+    One INCR-ed key per fixed window, expiring after two windows. If the
+    server can't be reached the request is counted in memory instead. A
+    breaker then skips the server for open_seconds, so an outage doesn't add
+    a connect timeout to every request.
+    """
+
+    def __init__(self, url, fallback=None, open_seconds=10.0):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._hit = self.client.register_script(_REDIS_HIT)
+        self.fallback = fallback or MemoryBackend()
+        self.breaker = CircuitBreaker('redis', min_calls=3, slow_call_seconds=0.05, open_seconds=open_seconds)
+        self._last_error_log = 0.0
+
+    def hit(self, key, quota, now):
+        window_index, elapsed = divmod(now, quota.window)
+        window_index = int(window_index)
+        try:
+            allowed, current, previous = self.breaker.call(
+                self._hit,
+                keys=[f"rl:{key}:{window_index}", f"rl:{key}:{window_index - 1}"],
+                args=[1 - elapsed / quota.window, quota.limit, math.ceil(2 * quota.window)]
+            )
+        except CircuitOpenError:
+            return self.fallback.hit(key, quota, now)
+        except Exception as e:
+            if now - self._last_error_log > 60:
+                self._last_error_log = now
+                logging.error(f"Rate limit backend unavailable, counting in memory: {str(e)}")
+            return self.fallback.hit(key, quota, now)
+        if allowed:
+            return True, 0
+        return False, retry_after(quota, elapsed, current, previous)
+
+
+def open_backend(url=None):
+    """RedisBackend for a redis:// URL, otherwise in-memory counters"""
+    if url:
+        return RedisBackend(url)
+    return MemoryBackend()
+
+
+def client_ip():
+    """The caller's address as seen by the outermost trusted proxy"""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if forwarded:
+        hops = forwarded.split(',')
+        return hops[max(0, len(hops) - TRUSTED_PROXY_HOPS)].strip()
+    return request.remote_addr or 'unknown'
+
+
+class RateLimiter:
+    """Flask middleware: per-route quotas counted per user (or per IP).
+
+    identity() returns a user ID for authenticated requests, or None to fall
+    back to the client IP. Routes in ip_routes are always counted per client
+    IP, whatever token is sent: on login and registration a token from one
+    account must not buy a fresh quota. Routes in shared_routes have a single
+    counter for all callers. Requests over quota get 429 with Retry-After.
+    Routes without a quota, and CORS preflights, are not counted.
+    """
+
+    def __init__(self, app, quotas, backend=None, identity=None, ip_routes=(), shared_routes=(),
+                 clock=time.time):
+        self.quotas = quotas
+        self.backend = backend or MemoryBackend()
+        self.identity = identity
+        self.ip_routes = frozenset(ip_routes)
+        self.shared_routes = frozenset(shared_routes)
+        self.clock = clock
+        self.rejected = 0
+        app.before_request(self.check)
+
+    def check(self):
+        rule = request.url_rule
+        if rule is None or request.method == 'OPTIONS':
+            return None
+        quota = self.quotas.get(rule.rule)
+        if quota is None:
+            return None
+
+        if rule.rule in self.shared_routes:
+            key = f"{rule.rule}|all"
+        else:
+            user_id = self.identity() if self.identity and rule.rule not in self.ip_routes else None
+            key = f"{rule.rule}|u:{user_id}" if user_id else f"{rule.rule}|ip:{client_ip()}"
+        allowed, wait = self.backend.hit(key, quota, self.clock())
+        if allowed:
+            return None
+
+        self.rejected += 1
+        response = jsonify({"error": "Too many requests", "retry_after": wait})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(wait)
+        return response
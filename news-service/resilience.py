@@ -0,0 +1,199 @@
+# resilience.py - Circuit breaker and last-known-good response cache
+#
+# Shared by news-service and user-service; the two copies are identical.
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from collections import deque, OrderedDict
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised by CircuitBreaker.call instead of calling a backend that is failing"""
+
+
+class CircuitBreaker:
+    """Stops calling a backend that keeps failing or responding slowly.
+
+    Outcomes of the last `window` calls are kept; a call counts as bad if it
+    raised or took longer than slow_call_seconds. Once at least min_calls are
+    recorded and the bad share reaches failure_rate, the breaker opens and
+    allow() returns False for open_seconds. After that one probe call is let
+    through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5,
+                 slow_call_seconds=2.0, open_seconds=30.0):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """Whether a call to the backend should be attempted now"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: a single probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) with its outcome recorded; CircuitOpenError while open"""
+        if not self.allow():
+            raise CircuitOpenError(f"circuit {self.name} is open")
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(type(e).__name__)
+            raise
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def record_success(self, elapsed_seconds):
+        if elapsed_seconds > self.slow_call_seconds:
+            self._record(False, f"slow call ({elapsed_seconds:.2f}s)")
+        else:
+            self._record(True)
+
+    def record_failure(self, reason='error'):
+        self._record(False, reason)
+
+    def _record(self, ok, reason=None):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    logging.info(f"Circuit {self.name} closed")
+                else:
+                    self._trip(reason)
+                return
+
+            self._outcomes.append(ok)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                bad = self._outcomes.count(False)
+                if bad / len(self._outcomes) >= self.failure_rate:
+                    self._trip(reason)
+
+    def _trip(self, reason):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logging.warning(f"Circuit {self.name} opened after {reason}; retrying in {self.open_seconds:.0f}s")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self._state,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': self._outcomes.count(False)
+            }
+
+
+def _size(payload):
+    return len(payload) if isinstance(payload, bytes) else 0
+
+
+class StaleCache:
+    """Last-known-good response payloads, in memory and optionally on disk.
+
+    Memory keeps the newest max_entries keys, and drops the oldest while
+    bytes payloads (e.g. already encoded JSON) add up to more than max_bytes.
+    Entries put with persist=True are also written to directory (at most once
+    per persist_interval seconds per key) so a restarted instance can still
+    serve them; only the first max_persisted keys are ever written.
+    """
+
+    def __init__(self, directory=None, dumps=json.dumps, max_entries=10000, max_bytes=64 * 2**20,
+                 max_persisted=100, persist_interval=30.0):
+        self.directory = directory
+        self.dumps = dumps
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_persisted = max_persisted
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._persisted_at = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        safe_key = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in key)
+        return os.path.join(self.directory, f"{safe_key}.json")
+
+    def put(self, key, payload, persist=False):
+        now = time.time()
+        with self._lock:
+            replaced = self._entries.pop(key, None)
+            if replaced is not None:
+                self._bytes -= _size(replaced[0])
+            self._entries[key] = (payload, now)
+            self._bytes += _size(payload)
+            while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= _size(evicted)
+            if not (persist and self.directory):
+                return
+            if key not in self._persisted_at and len(self._persisted_at) >= self.max_persisted:
+                return
+            if now - self._persisted_at.get(key, 0) < self.persist_interval:
+                return
+            self._persisted_at[key] = now
+
+        try:
+            data = self.dumps({'saved_at': now, 'payload': payload})
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logging.error(f"Error persisting stale cache entry {key}: {str(e)}")
+
+    def get(self, key):
+        """Return (payload, age_seconds), or (None, None) if nothing was ever cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.directory and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key)) as f:
+                    stored = json.load(f)
+                entry = (stored['payload'], stored['saved_at'])
+                with self._lock:
+                    self._entries.setdefault(key, entry)
+            except Exception as e:
+                logging.error(f"Error reading stale cache entry {key}: {str(e)}")
+        if entry is None:
+            return None, None
+        payload, saved_at = entry
+        return payload, time.time() - saved_at
@@ -0,0 +1,382 @@
+# news-service/search_index.py - In-memory full-text index over articles
+import os
+import re
+import math
+import heapq
+import pickle
+import logging
+import tempfile
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from itertools import accumulate
+from sys import intern
+from operator import itemgetter
+
+# 2: the watermark only moves on a catch-up, so version 1 snapshots may have gaps
+# 3: publish dates per article, for applying retention cutoffs
+SNAPSHOT_VERSION = 3
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his in is it its of on or
+that the their they this to was were will with you your not no we our after
+""".split())
+
+# Postings scored between yields to other greenlets (about 10 ms of work)
+SCORE_CHUNK = 32768
+
+# Title matches count more than matches in the description or source name
+FIELD_WEIGHTS = (('title', 3), ('content', 1), ('source', 1))
+
+
+def tokenize(text):
+    """Lowercase text and split it into indexable terms"""
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def _append_varint(buf, value):
+    """Append an unsigned int to buf using 7-bit variable length encoding"""
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _iter_postings(buf):
+    """Decode a posting list into (doc_number, term_frequency) pairs"""
+    doc = 0
+    value = 0
+    shift = 0
+    expect_tf = False
+    for byte in buf:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        if expect_tf:
+            yield doc, value
+        else:
+            doc += value
+        expect_tf = not expect_tf
+        value = 0
+        shift = 0
+
+
+def _decode_postings(buf):
+    """Decode a posting list into parallel sequences of doc numbers and term frequencies"""
+    if not buf:
+        return [], []
+    if max(buf) < 0x80:
+        # Every gap and frequency fits in one byte (true of most long lists,
+        # whose gaps are small), so the pairs can be split without a loop
+        return list(accumulate(buf[0::2])), buf[1::2]
+    docnos = []
+    tfs = []
+    for docno, tf in _iter_postings(buf):
+        docnos.append(docno)
+        tfs.append(tf)
+    return docnos, tfs
+
+
+def _as_utc(value):
+    """Normalize naive and Firestore datetimes to a plain UTC datetime"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(value.timestamp(), tz=timezone.utc)
+
+
+class InvertedIndex:
+    """Incrementally maintained BM25 index over article title/content/source.
+
+    Documents get sequential internal numbers, so each term's posting list is a
+    bytearray of varint-encoded (doc gap, term frequency) pairs that only ever
+    grows at the end.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # term -> [postings bytearray, last doc number, document frequency]
+        self._terms = {}
+        # docno -> article_id, None once the article has been removed
+        self._doc_ids = []
+        self._doc_categories = []
+        self._doc_lens = array('I')
+        # Publish time as a UTC timestamp, 0 if unknown
+        self._doc_dates = array('d')
+        self._docno_by_id = {}
+        self._total_len = 0
+        self._removed = 0
+        # The last retention run whose cutoffs have been applied
+        self.retention_run_id = None
+        # Every article published up to here has been indexed. Only a catch-up
+        # from the articles collection moves it; add() doesn't, since articles
+        # stored by other instances may still be missing.
+        self.watermark = None
+
+    def __len__(self):
+        return len(self._doc_ids) - self._removed
+
+    def __contains__(self, article_id):
+        return article_id in self._docno_by_id
+
+    def add(self, article_id, title='', content='', source='', category='', publish_date=None):
+        """Index one article. Returns False if it was already indexed."""
+        fields = {'title': title, 'content': content, 'source': source}
+        freqs = {}
+        for field, weight in FIELD_WEIGHTS:
+            for term in tokenize(fields[field]):
+                freqs[term] = freqs.get(term, 0) + weight
+
+        with self._lock:
+            if article_id in self._docno_by_id:
+                return False
+
+            docno = len(self._doc_ids)
+            self._doc_ids.append(article_id)
+            self._doc_categories.append(intern(category or ''))
+            self._docno_by_id[article_id] = docno
+
+            doc_len = sum(freqs.values())
+            self._doc_lens.append(doc_len)
+            self._doc_dates.append(_as_utc(publish_date).timestamp() if publish_date else 0.0)
+            self._total_len += doc_len
+
+            for term, tf in freqs.items():
+                entry = self._terms.get(term)
+                if entry is None:
+                    entry = [bytearray(), 0, 0]
+                    self._terms[intern(term)] = entry
+                _append_varint(entry[0], docno - entry[1])
+                _append_varint(entry[0], tf)
+                entry[1] = docno
+                entry[2] += 1
+
+        return True
+
+    def add_article(self, article_data):
+        """Index an article dict as stored in the articles collection"""
+        return self.add(
+            article_data.get('article_id'),
+            title=article_data.get('title', ''),
+            content=article_data.get('content', ''),
+            source=article_data.get('source', ''),
+            category=article_data.get('category', ''),
+            publish_date=article_data.get('publish_date')
+        )
+
+    def advance_watermark(self, publish_date):
+        """Record that every article published up to publish_date is indexed"""
+        publish_date = _as_utc(publish_date)
+        with self._lock:
+            if self.watermark is None or publish_date > self.watermark:
+                self.watermark = publish_date
+
+    def remove(self, article_id):
+        """Drop an article from results. Its postings stay until compact()."""
+        with self._lock:
+            docno = self._docno_by_id.pop(article_id, None)
+            if docno is None:
+                return False
+            self._doc_ids[docno] = None
+            self._total_len -= self._doc_lens[docno]
+            self._doc_lens[docno] = 0
+            self._removed += 1
+            return True
+
+    def remove_expired(self, cutoffs):
+        """Remove articles published before their category's cutoff, as retention archives them.
+
+        cutoffs maps category to datetime. Returns the number removed.
+        """
+        limits = {category: _as_utc(cutoff).timestamp() for category, cutoff in cutoffs.items()}
+        with self._lock:
+            expired = [
+                article_id for article_id, category, published in zip(self._doc_ids, self._doc_categories, self._doc_dates)
+                if article_id is not None and 0 < published < limits.get(category, 0)
+            ]
+            for article_id in expired:
+                self.remove(article_id)
+            return len(expired)
+
+    def removed_fraction(self):
+        with self._lock:
+            return self._removed / len(self._doc_ids) if self._doc_ids else 0.0
+
+    def compact(self):
+        """Rewrite posting lists without removed articles, renumbering the rest"""
+        with self._lock:
+            if not self._removed:
+                return
+            new_docno = {}
+            doc_ids = []
+            doc_categories = []
+            doc_lens = array('I')
+            doc_dates = array('d')
+            for docno, article_id in enumerate(self._doc_ids):
+                if article_id is None:
+                    continue
+                new_docno[docno] = len(doc_ids)
+                doc_ids.append(article_id)
+                doc_categories.append(self._doc_categories[docno])
+                doc_lens.append(self._doc_lens[docno])
+                doc_dates.append(self._doc_dates[docno])
+
+            terms = {}
+            for term, (postings, _, _) in self._terms.items():
+                entry = [bytearray(), 0, 0]
+                for docno, tf in _iter_postings(postings):
+                    renumbered = new_docno.get(docno)
+                    if renumbered is None:
+                        continue
+                    _append_varint(entry[0], renumbered - entry[1])
+                    _append_varint(entry[0], tf)
+                    entry[1] = renumbered
+                    entry[2] += 1
+                if entry[2]:
+                    terms[term] = entry
+
+            self._terms = terms
+            self._doc_ids = doc_ids
+            self._doc_categories = doc_categories
+            self._doc_lens = doc_lens
+            self._doc_dates = doc_dates
+            self._docno_by_id = {article_id: docno for docno, article_id in enumerate(doc_ids)}
+            self._removed = 0
+
+    def search(self, query, k=10, category=None):
+        """Return up to k (article_id, score) pairs ranked by BM25"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        # Copy what the query needs under the lock and score outside it.
+        # Document lists only grow and compact() replaces them, so the
+        # references stay consistent with the copied postings.
+        with self._lock:
+            n_docs = len(self._doc_ids) - self._removed
+            if n_docs <= 0:
+                return []
+            avg_len = self._total_len / n_docs
+            doc_lens = self._doc_lens
+            doc_categories = self._doc_categories
+            doc_ids = self._doc_ids
+            postings = [(bytes(entry[0]), entry[2]) for entry in map(self._terms.get, terms) if entry]
+
+        k1 = self.k1
+        norm_base = k1 * (1 - self.b)
+        norm_scale = k1 * self.b / avg_len
+
+        def keep(docno):
+            return doc_ids[docno] is not None and (not category or doc_categories[docno] == category)
+
+        # A term adds at most idf * (k1 + 1) to a score. Terms are scored
+        # rarest first; once the bounds of the remaining terms add up to less
+        # than the current k-th best score, no unseen article can reach the
+        # top k, so the rest only update articles already scored (MaxScore)
+        weighted = []
+        for buf, df in postings:
+            # Removed articles still count towards df until compact()
+            df = min(df, n_docs)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            weighted.append((idf * (k1 + 1), buf))
+        weighted.sort(key=itemgetter(0), reverse=True)
+        remaining_bound = sum(weight for weight, _ in weighted)
+
+        scores = {}
+        get_score = scores.get
+        for weight, buf in weighted:
+            docnos, tfs = _decode_postings(buf)
+            threshold = None
+            if len(scores) >= k:
+                kept = [score for docno, score in scores.items() if keep(docno)]
+                if len(kept) >= k:
+                    threshold = heapq.nlargest(k, kept)[-1]
+
+            if threshold is not None and remaining_bound < threshold:
+                tf_by_docno = dict(zip(docnos, tfs))
+                for docno in tf_by_docno.keys() & scores.keys():
+                    tf = tf_by_docno[docno]
+                    scores[docno] += weight * tf / (tf + norm_base + norm_scale * doc_lens[docno])
+            else:
+                for start in range(0, len(docnos), SCORE_CHUNK):
+                    for docno, tf in zip(docnos[start:start + SCORE_CHUNK], tfs[start:start + SCORE_CHUNK]):
+                        scores[docno] = get_score(docno, 0.0) + weight * tf / (tf + norm_base + norm_scale * doc_lens[docno])
+                    # Let other requests on the (gevent) worker run during long posting lists
+                    time.sleep(0)
+            remaining_bound -= weight
+
+        top = heapq.nlargest(k, ((docno, score) for docno, score in scores.items() if keep(docno)),
+                             key=itemgetter(1))
+        return [(doc_ids[docno], score) for docno, score in top]
+
+    def stats(self):
+        """Document, term and posting list sizes"""
+        with self._lock:
+            return {
+                'documents': len(self._doc_ids) - self._removed,
+                'removed': self._removed,
+                'terms': len(self._terms),
+                'posting_bytes': sum(len(entry[0]) for entry in self._terms.values()),
+                'watermark': self.watermark.isoformat() if self.watermark else None,
+                'retention_run_id': self.retention_run_id
+            }
+
+    def save(self, path):
+        """Write a snapshot of the index to path, replacing it atomically"""
+        with self._lock:
+            state = {
+                'version': SNAPSHOT_VERSION,
+                'k1': self.k1,
+                'b': self.b,
+                'terms': self._terms,
+                'doc_ids': self._doc_ids,
+                'doc_categories': self._doc_categories,
+                'doc_lens': self._doc_lens,
+                'doc_dates': self._doc_dates,
+                'total_len': self._total_len,
+                'removed': self._removed,
+                'watermark': self.watermark,
+                'retention_run_id': self.retention_run_id
+            }
+            # Unique temp file, so concurrent saves never rename each other's file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Restore an index from a snapshot, or return None if there is none"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+            if state.get('version') != SNAPSHOT_VERSION:
+                logging.warning(f"Ignoring search index snapshot with version {state.get('version')}")
+                return None
+
+            index = cls(k1=state['k1'], b=state['b'])
+            index._terms = state['terms']
+            index._doc_ids = state['doc_ids']
+            index._doc_categories = state['doc_categories']
+            index._doc_lens = state['doc_lens']
+            index._doc_dates = state['doc_dates']
+            index._total_len = state['total_len']
+            index._removed = state.get('removed', 0)
+            index.watermark = state['watermark']
+            index.retention_run_id = state['retention_run_id']
+            index._docno_by_id = {
+                article_id: docno for docno, article_id in enumerate(index._doc_ids) if article_id is not None
+            }
+            return index
+        except Exception as e:
+            logging.error(f"Error loading search index snapshot: {str(e)}")
+            return None
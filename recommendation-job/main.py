@@ -0,0 +1,235 @@
+# recommendation-job/main.py - Offline item-item collaborative filtering
+#
+# Builds a sparse user x article interaction matrix from user_preferences (or
+# exported engagement rows), computes the top-k most similar articles for each
+# article and writes them to the article_neighbors collection, where
+# user-service reads them as "readers also liked" candidates.
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import logging
+
+import numpy as np
+from scipy import sparse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same relative weights as the category score increments in user-service
+EVENT_WEIGHTS = {'like': 3.0, 'share': 2.0, 'view': 1.0}
+PREFERENCE_LISTS = {'liked_articles': 'like', 'shared_articles': 'share', 'viewed_articles': 'view'}
+
+NEIGHBORS_COLLECTION = 'article_neighbors'
+FIRESTORE_BATCH_SIZE = 500
+
+
+class InteractionMatrix:
+    """Accumulates (user, article, weight) triples and builds a CSR matrix"""
+
+    def __init__(self):
+        self.user_index = {}
+        self.article_index = {}
+        self.article_ids = []
+        self._rows = []
+        self._cols = []
+        self._weights = []
+
+    def add(self, user_id, article_id, event_type):
+        weight = EVENT_WEIGHTS.get(event_type)
+        if not user_id or not article_id or weight is None:
+            return
+        row = self.user_index.setdefault(user_id, len(self.user_index))
+        col = self.article_index.get(article_id)
+        if col is None:
+            col = self.article_index[article_id] = len(self.article_ids)
+            self.article_ids.append(article_id)
+        self._rows.append(row)
+        self._cols.append(col)
+        self._weights.append(weight)
+
+    def to_csr(self):
+        shape = (len(self.user_index), len(self.article_ids))
+        matrix = sparse.coo_matrix(
+            (np.asarray(self._weights, dtype=np.float32),
+             (np.asarray(self._rows, dtype=np.int32), np.asarray(self._cols, dtype=np.int32))),
+            shape=shape
+        ).tocsr()
+        # Repeated events on the same article (like + share) are summed;
+        # cap them so one enthusiastic user does not dominate a pair
+        matrix.sum_duplicates()
+        np.minimum(matrix.data, EVENT_WEIGHTS['like'] + EVENT_WEIGHTS['share'], out=matrix.data)
+        return matrix
+
+
+def load_from_preferences(db):
+    """Read interactions from the user_preferences collection"""
+    interactions = InteractionMatrix()
+    for doc in db.collection('user_preferences').stream():
+        prefs = doc.to_dict()
+        for field, event_type in PREFERENCE_LISTS.items():
+            for article_id in prefs.get(field, []):
+                interactions.add(doc.id, article_id, event_type)
+    return interactions
+
+
+def load_from_export(path):
+    """Read interactions from newline-delimited JSON engagement rows (BigQuery export)"""
+    interactions = InteractionMatrix()
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            interactions.add(row.get('user_id'), row.get('article_id'), row.get('event_type'))
+    return interactions
+
+
+def top_k_neighbors(matrix, k=20, min_score=0.01, block_size=2048, min_users=2):
+    """Top-k cosine-similar articles for every article.
+
+    Works through the article x article product in row blocks so only one
+    block of similarities is materialized at a time. Returns
+    (neighbor_indices, neighbor_scores) as lists of arrays, one per article.
+    """
+    # Articles as rows, L2-normalized so the dot product is cosine similarity
+    items = matrix.T.tocsr().astype(np.float32)
+    norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+    supported = np.diff(items.indptr) >= min_users
+    inv_norms = np.zeros_like(norms)
+    inv_norms[supported] = 1.0 / norms[supported]
+    items = sparse.diags(inv_norms).dot(items).tocsr()
+    items_t = items.T.tocsr()
+
+    n_items = items.shape[0]
+    neighbor_indices = [None] * n_items
+    neighbor_scores = [None] * n_items
+    empty_idx = np.empty(0, dtype=np.int32)
+    empty_scores = np.empty(0, dtype=np.float32)
+
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        block = items[start:stop].dot(items_t).tocsr()
+
+        for offset in range(stop - start):
+            item = start + offset
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            cols = block.indices[lo:hi]
+            scores = block.data[lo:hi]
+            keep = (scores >= min_score) & (cols != item)
+            cols, scores = cols[keep], scores[keep]
+            if len(scores) > k:
+                part = np.argpartition(-scores, k)[:k]
+                cols, scores = cols[part], scores[part]
+            order = np.argsort(-scores, kind='stable')
+            if len(order):
+                neighbor_indices[item] = cols[order].astype(np.int32)
+                neighbor_scores[item] = scores[order]
+            else:
+                neighbor_indices[item] = empty_idx
+                neighbor_scores[item] = empty_scores
+
+    return neighbor_indices, neighbor_scores
+
+
+def neighbor_lists(article_ids, neighbor_indices, neighbor_scores):
+    """Yield (article_id, [{article_id, score}, ...]) for articles with neighbors"""
+    for item, article_id in enumerate(article_ids):
+        cols = neighbor_indices[item]
+        if cols is None or len(cols) == 0:
+            continue
+        yield article_id, [
+            {'article_id': article_ids[col], 'score': round(float(score), 4)}
+            for col, score in zip(cols, neighbor_scores[item])
+        ]
+
+
+def write_to_firestore(db, lists, run_id):
+    """Store one article_neighbors document per article, in batched writes, stamped with run_id"""
+    from google.cloud import firestore
+
+    written = 0
+    batch = db.batch()
+    for article_id, neighbors in lists:
+        batch.set(db.collection(NEIGHBORS_COLLECTION).document(article_id), {
+            'neighbors': neighbors,
+            'run_id': run_id,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        written += 1
+        if written % FIRESTORE_BATCH_SIZE == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return written
+
+
+def delete_stale_neighbors(db, run_id):
+    """Delete article_neighbors documents not written by run_id (articles that lost all neighbors, or were deleted)"""
+    deleted = 0
+    batch = db.batch()
+    for doc in db.collection(NEIGHBORS_COLLECTION).select(['run_id']).stream():
+        # get() raises KeyError for a missing field; documents written before
+        # run_id existed have none and are deleted too
+        if (doc.to_dict() or {}).get('run_id') == run_id:
+            continue
+        batch.delete(doc.reference)
+        deleted += 1
+        if deleted % FIRESTORE_BATCH_SIZE == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return deleted
+
+
+def write_to_file(path, lists):
+    """Write neighbor lists as newline-delimited JSON"""
+    written = 0
+    with open(path, 'w') as f:
+        for article_id, neighbors in lists:
+            f.write(json.dumps({'article_id': article_id, 'neighbors': neighbors}) + '\n')
+            written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute 'readers also liked' article neighbors")
+    parser.add_argument('--input', help="NDJSON engagement export to read instead of user_preferences")
+    parser.add_argument('--output', help="NDJSON file to write instead of Firestore")
+    parser.add_argument('--k', type=int, default=int(os.environ.get('NEIGHBORS_K', 20)))
+    parser.add_argument('--min-score', type=float, default=float(os.environ.get('NEIGHBORS_MIN_SCORE', 0.01)))
+    args = parser.parse_args(argv)
+
+    db = None
+    if not args.input or not args.output:
+        from google.cloud import firestore
+        db = firestore.Client()
+
+    start = time.time()
+    interactions = load_from_export(args.input) if args.input else load_from_preferences(db)
+    matrix = interactions.to_csr()
+    logger.info(f"Interaction matrix: {matrix.shape[0]} users x {matrix.shape[1]} articles, {matrix.nnz} entries")
+
+    neighbor_indices, neighbor_scores = top_k_neighbors(matrix, k=args.k, min_score=args.min_score)
+    lists = neighbor_lists(interactions.article_ids, neighbor_indices, neighbor_scores)
+
+    if args.output:
+        written = write_to_file(args.output, lists)
+    else:
+        run_id = uuid.uuid4().hex
+        written = write_to_firestore(db, lists, run_id)
+        if written:
+            deleted = delete_stale_neighbors(db, run_id)
+            logger.info(f"Deleted {deleted} stale {NEIGHBORS_COLLECTION} documents")
+        else:
+            # Most likely a failed or empty load; keep the previous run's neighbors
+            logger.warning(f"No neighbors computed, leaving {NEIGHBORS_COLLECTION} as it is")
+
+    logger.info(f"✅ Wrote neighbors for {written} articles in {time.time() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# retention-job/main.py - Scheduled article retention
+#
+# Archives articles older than their category's retention limit, deletes them
+# from Firestore and removes their IDs from user_preferences. Runs as a Cloud
+# Run Job; news-service drops the archived articles from its search index once
+# the run has completed.
+import os
+import sys
+import logging
+
+from google.cloud import firestore
+
+from retention import RetentionJob, load_policies, open_archive
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same categories as news-service fetches
+CATEGORIES = ['technology', 'business', 'sports', 'entertainment', 'science']
+
+
+def main():
+    archive = os.environ.get('RETENTION_ARCHIVE', '')
+    if not archive:
+        # Articles are deleted once archived, so never default to a container's scratch disk
+        logger.error("RETENTION_ARCHIVE is not set (gs://bucket/prefix or a local directory)")
+        return 1
+
+    job = RetentionJob(
+        firestore.Client(),
+        open_archive(archive),
+        load_policies(os.environ.get('RETENTION_POLICY', '')),
+        CATEGORIES,
+        max_writes_per_second=int(os.environ.get('RETENTION_MAX_WRITES_PER_SECOND', 100))
+    )
+    if job.is_running():
+        logger.warning("Another execution is running this retention pass; exiting")
+        return 0
+
+    state = job.run()
+    # Non-zero lets Cloud Run retry the task, which resumes from the checkpoint
+    return 0 if state['status'] in ('completed', 'taken_over') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# retention-job/retention.py - Article retention, archival and preference cleanup
+import os
+import io
+import json
+import gzip
+import time
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+STATE_COLLECTION = 'retention_state'
+STATE_DOCUMENT = 'articles'
+PREFERENCE_LISTS = ('liked_articles', 'shared_articles', 'viewed_articles')
+
+# A running job refreshes updated_at after every batch; a "running" state
+# older than this is treated as an interrupted run and resumed
+STALE_RUN_SECONDS = 600
+
+
+class RunTakenOver(Exception):
+    """Another execution resumed this run after it went quiet for STALE_RUN_SECONDS"""
+
+
+def load_policies(raw, default_days=60):
+    """Parse a JSON {category: max_age_days} policy. "default" covers other categories."""
+    policies = {'default': default_days}
+    if raw:
+        policies.update({category.lower(): int(days) for category, days in json.loads(raw).items()})
+    return policies
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_batch(articles):
+    """Gzipped newline-delimited JSON for a batch of article dicts"""
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+        for article in articles:
+            gz.write(json.dumps(article, default=_json_default, separators=(',', ':')).encode('utf-8'))
+            gz.write(b'\n')
+    return buf.getvalue()
+
+
+class LocalArchive:
+    """Archive batches as .ndjson.gz files under a local directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, name, articles):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_batch(articles))
+        os.replace(tmp_path, path)
+        return path
+
+
+class GCSArchive:
+    """Archive batches as .ndjson.gz objects in a Cloud Storage bucket"""
+
+    def __init__(self, bucket, prefix=''):
+        from google.cloud import storage
+        self.bucket = storage.Client().bucket(bucket)
+        self.prefix = prefix.strip('/')
+
+    def write(self, name, articles):
+        blob_name = f"{self.prefix}/{name}" if self.prefix else name
+        self.bucket.blob(blob_name).upload_from_string(encode_batch(articles), content_type='application/gzip')
+        return f"gs://{self.bucket.name}/{blob_name}"
+
+
+def open_archive(location):
+    """gs://bucket/prefix for Cloud Storage, anything else is a local directory"""
+    if location.startswith('gs://'):
+        bucket, _, prefix = location[len('gs://'):].partition('/')
+        return GCSArchive(bucket, prefix)
+    if location.startswith('file://'):
+        location = location[len('file://'):]
+    return LocalArchive(location)
+
+
+class RetentionJob:
+    """Moves expired articles to an archive and prunes dangling preference IDs.
+
+    Progress is checkpointed in retention_state/articles after every batch, so
+    an interrupted run picks up where it stopped. Expired articles are found
+    with the same query each time (category + publish_date below a cutoff
+    fixed at the start of the run), and each archive batch is named after its
+    first article, so a batch replayed after a crash overwrites its own file.
+    Writes are paced to max_writes_per_second.
+
+    The state records which execution owns the run. An execution that finds
+    another one has taken over stops at its next checkpoint.
+    """
+
+    def __init__(self, db, archive, policies, categories, batch_size=200,
+                 prune_page_size=100, max_writes_per_second=100):
+        self.db = db
+        self.archive = archive
+        self.policies = policies
+        self.categories = categories
+        self.batch_size = batch_size
+        self.prune_page_size = prune_page_size
+        self.max_writes_per_second = max_writes_per_second
+        self.owner = uuid.uuid4().hex[:12]
+        self.state_ref = db.collection(STATE_COLLECTION).document(STATE_DOCUMENT)
+
+    def status(self):
+        doc = self.state_ref.get()
+        return doc.to_dict() if doc.exists else {'status': 'never_run'}
+
+    def is_running(self):
+        state = self.status()
+        if state.get('status') != 'running':
+            return False
+        updated_at = state.get('updated_at')
+        return updated_at is not None and (datetime.now(timezone.utc) - updated_at).total_seconds() < STALE_RUN_SECONDS
+
+    def _new_state(self):
+        now = datetime.now(timezone.utc)
+        cutoffs = {
+            category: now - timedelta(days=self.policies.get(category, self.policies['default']))
+            for category in self.categories
+        }
+        return {
+            'run_id': uuid.uuid4().hex[:12],
+            'status': 'running',
+            'phase': 'archive',
+            'cutoffs': cutoffs,
+            'category_index': 0,
+            'prune_cursor': None,
+            'archived': 0,
+            'pruned_users': 0,
+            'pruned_ids': 0,
+            'started_at': now,
+            'finished_at': None,
+            'error': None
+        }
+
+    def _save(self, state, claim=False):
+        if not claim:
+            current = self.state_ref.get()
+            owner = current.get('owner') if current.exists else None
+            if owner != self.owner:
+                raise RunTakenOver(f"Retention run {state['run_id']} was resumed by {owner}")
+        state['owner'] = self.owner
+        state['updated_at'] = datetime.now(timezone.utc)
+        self.state_ref.set(state)
+
+    def _throttle(self, writes, started):
+        """Sleep so that writes issued since started stay under the write budget"""
+        if self.max_writes_per_second:
+            remaining = writes / self.max_writes_per_second - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def run(self):
+        """Run (or resume) a retention pass. Returns the final state."""
+        state = self.status()
+        if state.get('status') in ('running', 'failed') and state.get('run_id'):
+            logging.info(f"Resuming retention run {state['run_id']} in phase {state['phase']}")
+            state['status'] = 'running'
+            state['error'] = None
+        else:
+            state = self._new_state()
+            logging.info(f"Starting retention run {state['run_id']}")
+        self._save(state, claim=True)
+
+        try:
+            if state['phase'] == 'archive':
+                self._archive_expired(state)
+                state['phase'] = 'prune'
+                state['prune_cursor'] = None
+                self._save(state)
+
+            if state['phase'] == 'prune':
+                self._prune_preferences(state)
+
+            state['phase'] = 'done'
+            state['status'] = 'completed'
+            state['finished_at'] = datetime.now(timezone.utc)
+            self._save(state)
+            logging.info(f"✅ Retention run {state['run_id']}: archived {state['archived']} articles, "
+                         f"pruned {state['pruned_ids']} IDs from {state['pruned_users']} users")
+        except RunTakenOver as e:
+            # The state now belongs to the other execution; leave it alone
+            logging.error(str(e))
+            state['status'] = 'taken_over'
+        except Exception as e:
+            logging.error(f"Retention run {state['run_id']} failed: {str(e)}", exc_info=True)
+            state['status'] = 'failed'
+            state['error'] = str(e)
+            self._save(state)
+
+        return state
+
+    def _archive_expired(self, state):
+        while state['category_index'] < len(self.categories):
+            category = self.categories[state['category_index']]
+            cutoff = state['cutoffs'][category]
+
+            while True:
+                started = time.monotonic()
+                docs = list(
+                    self.db.collection('articles')
+                    .where('category', '==', category)
+                    .where('publish_date', '<', cutoff)
+                    .order_by('publish_date')
+                    .limit(self.batch_size)
+                    .stream()
+                )
+                if not docs:
+                    break
+
+                articles = []
+                for doc in docs:
+                    article_data = doc.to_dict()
+                    article_data.setdefault('article_id', doc.id)
+                    articles.append(article_data)
+
+                name = f"{category}/{cutoff:%Y%m%d}/{docs[0].id}.ndjson.gz"
+                location = self.archive.write(name, articles)
+
+                batch = self.db.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
+                batch.commit()
+
+                state['archived'] += len(docs)
+                self._save(state)
+                logging.info(f"Archived {len(docs)} {category} articles to {location}")
+                self._throttle(len(docs) + 1, started)
+
+            state['category_index'] += 1
+            self._save(state)
+
+    def _prune_preferences(self, state):
+        """Remove IDs of articles that no longer exist from user_preferences lists"""
+        while True:
+            started = time.monotonic()
+            query = self.db.collection('user_preferences')\
+                .order_by(FieldPath.document_id())\
+                .limit(self.prune_page_size)
+            if state['prune_cursor']:
+                query = query.start_after({FieldPath.document_id(): state['prune_cursor']})
+            docs = list(query.stream())
+            if not docs:
+                return
+
+            referenced = set()
+            prefs_by_user = {}
+            for doc in docs:
+                prefs = doc.to_dict()
+                prefs_by_user[doc.id] = (doc.reference, prefs)
+                for field in PREFERENCE_LISTS:
+                    referenced.update(prefs.get(field, []))
+
+            existing = set()
+            referenced = [article_id for article_id in referenced if article_id]
+            for i in range(0, len(referenced), 300):
+                refs = [self.db.collection('articles').document(article_id) for article_id in referenced[i:i + 300]]
+                existing.update(doc.id for doc in self.db.get_all(refs) if doc.exists)
+
+            batch = self.db.batch()
+            writes = 0
+            for user_id, (reference, prefs) in prefs_by_user.items():
+                update = {}
+                for field in PREFERENCE_LISTS:
+                    missing = [article_id for article_id in prefs.get(field, []) if article_id not in existing]
+                    if missing:
+                        # ArrayRemove leaves concurrent appends from /engagement intact
+                        update[field] = firestore.ArrayRemove(missing)
+                        state['pruned_ids'] += len(missing)
+                if update:
+                    batch.update(reference, update)
+                    writes += 1
+            if writes:
+                batch.commit()
+                state['pruned_users'] += writes
+
+            state['prune_cursor'] = docs[-1].id
+            self._save(state)
+            self._throttle(writes + 1, started)
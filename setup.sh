@@ -35,7 +35,8 @@ gcloud run deploy news-service \
     --platform managed \
     --allow-unauthenticated \
     --memory 512Mi \
-    --cpu 1
+    --cpu 1 \
+    --concurrency 1000
 
 NEWS_SERVICE_URL=$(gcloud run services describe news-service --region $REGION --format 'value(status.url)')
 echo "✅ News Service deployed: $NEWS_SERVICE_URL"
@@ -1,13 +1,22 @@
 # user-service/main.py - COMPLETE VERSION WITH ALL FIXES
 import os
 import json
+import uuid
+import atexit
+import math
+import heapq
 import logging
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import Flask, request, jsonify, g
 from google.cloud import firestore, pubsub_v1
 from flask_cors import CORS
 import jwt
 import bcrypt
+from trending import TrendingAggregator
+from resilience import CircuitBreaker, CircuitOpenError, StaleCache
+from articles import Article, FeedEncoder
+from rate_limit import RateLimiter, load_quotas, open_backend
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -30,6 +39,99 @@ topic_path = publisher.topic_path(PROJECT_ID, "engagement-topic")
 
 logging.info(f"Pub/Sub topic path: {topic_path}")
 
+# Trending aggregation. Each instance consumes the full engagement stream from
+# a subscription of its own, created at startup and replayed back over the
+# trending window (the topic must retain messages that long). Without one
+# (TRENDING_SUBSCRIPTION_PREFIX empty, or creating it failed) an instance only
+# counts the events it publishes itself.
+TRENDING_SUBSCRIPTION_PREFIX = os.environ.get('TRENDING_SUBSCRIPTION_PREFIX', 'trending-user-service')
+# Pub/Sub deletes a subscription after a day without a subscriber
+TRENDING_SUBSCRIPTION_TTL_SECONDS = 86400
+MAX_TRENDING_RESULTS = 100
+
+# Firestore circuit breaker and last-known-good feeds for the recommendation
+# endpoints, served with "stale": true while the breaker is open or reads fail
+FIRESTORE_TIMEOUT_SECONDS = float(os.environ.get('FIRESTORE_TIMEOUT_SECONDS', 5))
+firestore_breaker = CircuitBreaker(
+    'firestore',
+    slow_call_seconds=float(os.environ.get('FIRESTORE_SLOW_CALL_SECONDS', 2)),
+    open_seconds=float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+)
+# Feed responses are assembled from per-article JSON cached by ID and version
+feed_encoder = FeedEncoder()
+# Per-user feeds are held as encoded JSON, within STALE_CACHE_MAX_MB in total
+stale_cache = StaleCache(
+    os.environ.get('STALE_CACHE_DIR', '/tmp/stale-cache/user-service'),
+    dumps=feed_encoder.dumps,
+    max_bytes=int(os.environ.get('STALE_CACHE_MAX_MB', 64)) * 2**20
+)
+# Users whose own feed isn't cached get the popular feed while the breaker is
+# open, so keep it fresh even when no request falls back to it
+POPULAR_REFRESH_SECONDS = int(os.environ.get('POPULAR_REFRESH_SECONDS', 300))
+popular_refresh_lock = threading.Lock()
+
+# recommendation_score bands, so that no tier can overtake the one above it:
+# liked articles 1000; "readers also liked" 500-900, similarity (cosine,
+# summed over at most 10 liked articles) adding up to 400; category matches
+# 1-100, the category's score relative to the user's top category
+ALSO_LIKED_BASE_SCORE = 500
+ALSO_LIKED_SIMILARITY_WEIGHT = 40
+CATEGORY_SCORE_SCALE = 100
+trending = TrendingAggregator(
+    bucket_seconds=int(os.environ.get('TRENDING_BUCKET_SECONDS', 300)),
+    num_buckets=int(os.environ.get('TRENDING_BUCKETS', 24)),
+    half_life_seconds=int(os.environ.get('TRENDING_HALF_LIFE_SECONDS', 3600))
+)
+
+def on_engagement_message(message):
+    """Pub/Sub callback feeding engagement events into the trending aggregator"""
+    try:
+        event_data = json.loads(message.data.decode('utf-8'))
+        # Replayed events count at the time they were published
+        trending.record(event_data.get('article_id'), event_data.get('event_type'), message.publish_time.timestamp())
+    except Exception as e:
+        logging.error(f"Error aggregating engagement message: {str(e)}")
+    message.ack()
+
+def open_trending_stream():
+    """Subscribe this instance to engagement-topic, replaying the trending window. None on failure."""
+    try:
+        subscriber = pubsub_v1.SubscriberClient()
+        subscription_path = subscriber.subscription_path(
+            PROJECT_ID, f"{TRENDING_SUBSCRIPTION_PREFIX}-{uuid.uuid4().hex[:12]}")
+        subscriber.create_subscription(request={
+            'name': subscription_path,
+            'topic': topic_path,
+            'ack_deadline_seconds': 60,
+            'message_retention_duration': {'seconds': 600},
+            'expiration_policy': {'ttl': {'seconds': TRENDING_SUBSCRIPTION_TTL_SECONDS}}
+        })
+        atexit.register(close_trending_stream, subscriber, subscription_path)
+    except Exception as e:
+        logging.error(f"Error creating trending subscription, counting local events only: {str(e)}")
+        return None
+
+    window_seconds = trending.bucket_seconds * trending.num_buckets
+    try:
+        subscriber.seek(request={
+            'subscription': subscription_path,
+            'time': datetime.now(timezone.utc) - timedelta(seconds=window_seconds)
+        })
+    except Exception as e:
+        logging.warning(f"Could not replay engagement-topic, trending starts empty: {str(e)}")
+
+    logging.info(f"Consuming engagement stream from {subscription_path}")
+    return subscriber.subscribe(subscription_path, callback=on_engagement_message)
+
+def close_trending_stream(subscriber, subscription_path):
+    """Delete this instance's subscription on shutdown (its TTL covers crashes)"""
+    try:
+        subscriber.delete_subscription(request={'subscription': subscription_path})
+    except Exception as e:
+        logging.warning(f"Error deleting {subscription_path}: {str(e)}")
+
+trending_stream = open_trending_stream() if TRENDING_SUBSCRIPTION_PREFIX else None
+
 #######################################
 # Helper Functions
 #######################################
@@ -62,6 +164,21 @@ def verify_token(token):
     except jwt.InvalidTokenError:
         return None
 
+def authenticated_user():
+    """Payload of the request's bearer token, decoded once per request, or None"""
+    if 'auth_payload' not in g:
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            g.auth_payload = verify_token(auth_header.replace('Bearer ', ''))
+        else:
+            g.auth_payload = None
+    return g.auth_payload
+
+def rate_limit_user():
+    """Rate limit authenticated requests per user rather than per IP"""
+    payload = authenticated_user()
+    return payload['user_id'] if payload else None
+
 def require_auth(f):
     """Decorator to require authentication"""
     def wrapper(*args, **kwargs):
@@ -69,8 +186,7 @@ def require_auth(f):
         if not auth_header.startswith('Bearer '):
             return jsonify({"error": "No token provided"}), 401
         
-        token = auth_header.replace('Bearer ', '')
-        payload = verify_token(token)
+        payload = authenticated_user()
         
         if not payload:
             return jsonify({"error": "Invalid or expired token"}), 401
@@ -83,6 +199,24 @@ def require_auth(f):
     wrapper.__name__ = f.__name__
     return wrapper
 
+# Rate limits per route, counted per user when a valid token is sent and per
+# client IP otherwise ("limit/seconds"); login and registration always per
+# IP. Overridable with a RATE_LIMITS JSON object; RATE_LIMIT_REDIS_URL shares
+# counters across instances.
+RATE_LIMIT_DEFAULTS = {
+    '/auth/login': '10/60',
+    '/auth/register': '5/60',
+    '/engagement': '120/60',
+    '/users/me/recommendations': '60/60'
+}
+rate_limiter = RateLimiter(
+    app,
+    load_quotas(os.environ.get('RATE_LIMITS', ''), RATE_LIMIT_DEFAULTS),
+    backend=open_backend(os.environ.get('RATE_LIMIT_REDIS_URL')),
+    identity=rate_limit_user,
+    ip_routes=('/auth/login', '/auth/register')
+)
+
 #######################################
 # Routes
 #######################################
@@ -92,7 +226,8 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "service": "user-service",
-        "features": ["auth", "recommendations", "engagement"]
+        "features": ["auth", "recommendations", "engagement"],
+        "circuits": [firestore_breaker.snapshot()]
     }), 200
 
 @app.route('/auth/register', methods=['POST', 'OPTIONS'])
@@ -289,6 +424,10 @@ def handle_engagement():
             logging.error(f"❌ Pub/Sub publish failed: {str(pub_error)}")
             return jsonify({"error": "Failed to publish to Pub/Sub"}), 500
         
+        # Count it towards trending unless this instance's subscription will deliver it
+        if trending_stream is None:
+            trending.record(event_data['article_id'], event_data['event_type'])
+        
         # Update user preferences in Firestore (for recommendations)
         update_user_preferences(request.user_id, event_data)
 
@@ -363,12 +502,14 @@ def update_user_preferences(user_id, engagement_data):
 @require_auth
 def get_recommendations():
     """Get personalized recommendations"""
+    cache_key = f"recommendations-{request.user_id}"
+    backend_errors = 0
     try:
         logging.info(f"📊 Getting recommendations for user: {request.user_id}")
         
         # Get user profile
         user_ref = db.collection('users').document(request.user_id)
-        user_doc = user_ref.get()
+        user_doc = firestore_read(user_ref.get)
         
         if not user_doc.exists:
             logging.error(f"User {request.user_id} not found")
@@ -385,7 +526,7 @@ def get_recommendations():
         
         # Get user preferences
         pref_ref = db.collection('user_preferences').document(request.user_id)
-        pref_doc = pref_ref.get()
+        pref_doc = firestore_read(pref_ref.get)
         
         # Build category scores
         category_scores = {}
@@ -421,22 +562,44 @@ def get_recommendations():
             for article_id in liked_articles[:10]:
                 try:
                     article_ref = db.collection('articles').document(article_id)
-                    article_doc = article_ref.get()
+                    article_doc = firestore_read(article_ref.get)
                     
                     if article_doc.exists:
-                        article_data = article_doc.to_dict()
-                        if 'article_id' not in article_data:
-                            article_data['article_id'] = article_id
-                        article_data['recommendation_score'] = 1000
-                        article_data['recommendation_reason'] = "You liked this"
-                        article_data['is_liked'] = True
-                        recommended_articles.append(article_data)
+                        article = Article.from_snapshot(article_doc)
+                        article.annotate(
+                            recommendation_score=1000,
+                            recommendation_reason="You liked this",
+                            is_liked=True
+                        )
+                        recommended_articles.append(article)
                         seen_article_ids.add(article_id)
                 except Exception as e:
+                    backend_errors += 1
                     logging.error(f"Error fetching liked article: {str(e)}")
         
-        # STEP 2: Category-based articles
+        # STEP 2: Articles read by people who liked the same articles
+        if liked_articles:
+            try:
+                also_liked = load_also_liked(liked_articles[:10], seen_article_ids | set(liked_articles))
+                logging.info(f"Found {len(also_liked)} 'readers also liked' articles")
+                
+                for article, similarity in also_liked:
+                    article.annotate(
+                        recommendation_score=ALSO_LIKED_BASE_SCORE + ALSO_LIKED_SIMILARITY_WEIGHT * similarity,
+                        recommendation_reason="Readers who liked what you liked also read this",
+                        is_liked=False
+                    )
+                    recommended_articles.append(article)
+                    seen_article_ids.add(article.article_id)
+            except Exception as e:
+                backend_errors += 1
+                logging.error(f"Error fetching 'readers also liked' articles: {str(e)}")
+        
+        # STEP 3: Category-based articles
+        # Engagement makes category scores unbounded; scale them into their band
+        top_score = max(top_categories[0][1], 1)
         for category, score in top_categories[:5]:
+            score = max(1, round(CATEGORY_SCORE_SCALE * score / top_score))
             try:
                 logging.info(f"Fetching articles for category: {category}")
                 
@@ -445,86 +608,233 @@ def get_recommendations():
                     .order_by('publish_date', direction=firestore.Query.DESCENDING)\
                     .limit(20)
                 
-                articles_list = list(articles_query.stream())
+                articles_list = firestore_read(articles_query.get)
                 
                 logging.info(f"Found {len(articles_list)} articles for {category}")
                 
                 for doc in articles_list:
-                    article_data = doc.to_dict()
                     article_id = doc.id
                     
                     if article_id in seen_article_ids:
                         continue
                     
-                    if 'article_id' not in article_data:
-                        article_data['article_id'] = article_id
+                    article = Article.from_snapshot(doc)
                     
-                    article_data['recommendation_score'] = score
-                    article_data['recommendation_reason'] = f"Based on your interest in {category}"
-                    article_data['is_liked'] = article_id in liked_articles
+                    # Popularity only breaks ties between equal category scores:
+                    # x / (1 + x) of the log-damped trending score stays below 1
+                    popularity = math.log1p(trending.score(article_id))
+                    article.annotate(
+                        recommendation_score=score + round(popularity / (1 + popularity), 3),
+                        recommendation_reason=f"Based on your interest in {category}",
+                        is_liked=article_id in liked_articles
+                    )
                     
-                    recommended_articles.append(article_data)
+                    recommended_articles.append(article)
                     seen_article_ids.add(article_id)
                     
             except Exception as e:
+                backend_errors += 1
                 logging.error(f"Error fetching category {category}: {str(e)}")
         
         # Sort by score
         recommended_articles.sort(
-            key=lambda x: x.get('recommendation_score', 0),
+            key=lambda x: x.annotations['recommendation_score'],
             reverse=True
         )
         
         logging.info(f"✅ Generated {len(recommended_articles)} recommendations")
         
+        response = {
+            "articles": recommended_articles[:30],
+            "count": len(recommended_articles[:30]),
+            "based_on": [cat for cat, score in top_categories[:5]]
+        }
+        
+        # Some reads failed: prefer the last complete feed over a partial one
+        if backend_errors:
+            logging.warning(f"{backend_errors} Firestore reads failed, serving last good recommendations")
+            return stale_response([cache_key, 'popular'], dict(response, stale=False))
+        
         if len(recommended_articles) == 0:
             logging.warning("No recommendations found, using fallback")
             return get_popular_articles()
         
-        return jsonify({
-            "articles": recommended_articles[:30],
-            "count": len(recommended_articles[:30]),
-            "based_on": [cat for cat, score in top_categories[:5]]
-        }), 200
+        # Per-user feeds are kept in memory only; 'popular' is the on-disk fallback
+        body = feed_encoder.encode(response)
+        stale_cache.put(cache_key, body)
+        _, popular_age = stale_cache.get('popular')
+        if popular_age is None or popular_age > POPULAR_REFRESH_SECONDS:
+            threading.Thread(target=refresh_popular_articles, daemon=True).start()
+        
+        return feed_encoder.response(feed_encoder.extend(body, {"stale": False})), 200
         
+    except CircuitOpenError as e:
+        return stale_response([cache_key, 'popular'], {
+            "articles": [],
+            "count": 0,
+            "based_on": [],
+            "error": "Firestore unavailable"
+        }, error=str(e))
     except Exception as e:
         logging.error(f"Error getting recommendations: {str(e)}", exc_info=True)
-        return get_popular_articles()
+        # Query popular articles live only if there is no last good feed to serve
+        return stale_response([cache_key, 'popular'], get_popular_articles, error=str(e))
+
+def firestore_read(method, *args):
+    """Run a Firestore read under the circuit breaker, with the read timeout"""
+    def read():
+        result = method(*args, timeout=FIRESTORE_TIMEOUT_SECONDS)
+        # get_all() streams: its RPC runs while the iterator is consumed
+        return list(result) if hasattr(result, '__next__') else result
+    return firestore_breaker.call(read)
+
+def stale_response(cache_keys, fallback, error=None):
+    """First cached payload among cache_keys flagged as stale, or fallback if there is none.
+
+    fallback is a response body, or a function returning the response to send.
+    """
+    for cache_key in cache_keys:
+        payload, age = stale_cache.get(cache_key)
+        if payload is not None:
+            flags = {"stale": True, "stale_age_seconds": round(age, 1)}
+            if error:
+                flags['error'] = error
+            if isinstance(payload, bytes):
+                return feed_encoder.response(feed_encoder.extend(payload, flags)), 200
+            return feed_encoder.response(dict(payload, **flags)), 200
+    if callable(fallback):
+        return fallback()
+    return feed_encoder.response(fallback), 200
+
+def load_also_liked(article_ids, exclude, limit=10):
+    """'Readers also liked' candidates from the neighbor lists written by recommendation-job"""
+    refs = [db.collection('article_neighbors').document(article_id) for article_id in article_ids]
+    
+    similarity = {}
+    for doc in firestore_read(db.get_all, refs):
+        if not doc.exists:
+            continue
+        for neighbor in doc.to_dict().get('neighbors', []):
+            neighbor_id = neighbor['article_id']
+            if neighbor_id not in exclude:
+                similarity[neighbor_id] = similarity.get(neighbor_id, 0) + neighbor['score']
+    
+    top = heapq.nlargest(limit, similarity.items(), key=lambda x: x[1])
+    if not top:
+        return []
+    
+    article_refs = [db.collection('articles').document(article_id) for article_id, _ in top]
+    docs_by_id = {doc.id: doc for doc in firestore_read(db.get_all, article_refs) if doc.exists}
+    
+    result = []
+    for article_id, score in top:
+        doc = docs_by_id.get(article_id)
+        if doc is None:
+            continue
+        result.append((Article.from_snapshot(doc), score))
+    
+    return result
 
-def get_popular_articles():
-    """Fallback articles"""
+def load_trending_articles(limit):
+    """Trending articles with their decayed engagement, most popular first"""
+    top = trending.top(limit)
+    if not top:
+        return []
+    
+    refs = [db.collection('articles').document(article_id) for article_id, _, _ in top]
+    docs_by_id = {doc.id: doc for doc in firestore_read(db.get_all, refs) if doc.exists}
+    
+    result = []
+    for article_id, score, counts in top:
+        doc = docs_by_id.get(article_id)
+        if doc is None:
+            continue
+        article = Article.from_snapshot(doc)
+        article.annotate(
+            trending_score=round(score, 3),
+            engagement={event_type: round(count, 2) for event_type, count in counts.items()}
+        )
+        result.append(article)
+    
+    return result
+
+@app.route('/news/trending', methods=['GET'])
+def get_trending():
+    """Articles with the most recent engagement"""
     try:
-        logging.info("Fetching popular articles")
+        limit = min(int(request.args.get('limit', 20)), MAX_TRENDING_RESULTS)
+        result = load_trending_articles(limit)
+        
+        logging.info(f"Returning {len(result)} trending articles")
         
+        return feed_encoder.response({
+            "articles": result,
+            "count": len(result),
+            "events_recorded": trending.events_recorded
+        }), 200
+        
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    except Exception as e:
+        logging.error(f"Error getting trending articles: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def load_popular_articles():
+    """Trending articles topped up with the newest; cached as the 'popular' stale feed"""
+    result = load_trending_articles(20)
+    seen_article_ids = {article.article_id for article in result}
+    based_on = ["trending"] if result else ["popular"]
+    
+    if len(result) < 20:
         articles_query = db.collection('articles')\
             .order_by('publish_date', direction=firestore.Query.DESCENDING)\
             .limit(20)
         
-        articles_list = list(articles_query.stream())
+        for doc in firestore_read(articles_query.get):
+            if len(result) >= 20:
+                break
+            if doc.id in seen_article_ids:
+                continue
+            result.append(Article.from_snapshot(doc))
+    
+    response = {
+        "articles": result,
+        "count": len(result),
+        "based_on": based_on
+    }
+    stale_cache.put('popular', response, persist=True)
+    return response
+
+def refresh_popular_articles():
+    """Background refresh of the 'popular' stale feed; one at a time"""
+    if not popular_refresh_lock.acquire(blocking=False):
+        return
+    try:
+        load_popular_articles()
+    except Exception as e:
+        logging.error(f"Error refreshing popular articles: {str(e)}")
+    finally:
+        popular_refresh_lock.release()
+
+def get_popular_articles():
+    """Fallback articles: trending first, topped up with the newest"""
+    try:
+        logging.info("Fetching popular articles")
         
-        result = []
-        for doc in articles_list:
-            article_data = doc.to_dict()
-            if 'article_id' not in article_data:
-                article_data['article_id'] = doc.id
-            result.append(article_data)
+        response = load_popular_articles()
         
-        logging.info(f"Returning {len(result)} popular articles")
+        logging.info(f"Returning {response['count']} popular articles")
         
-        return jsonify({
-            "articles": result,
-            "count": len(result),
-            "based_on": ["popular"]
-        }), 200
+        return feed_encoder.response(dict(response, stale=False)), 200
         
     except Exception as e:
         logging.error(f"Error getting popular articles: {str(e)}")
-        return jsonify({
+        return stale_response(['popular'], {
             "articles": [],
             "count": 0,
             "based_on": [],
             "error": str(e)
-        }), 200
+        }, error=str(e))
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
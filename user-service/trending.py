@@ -0,0 +1,157 @@
+# user-service/trending.py - Streaming engagement aggregation for trending articles
+import time
+import heapq
+import hashlib
+import threading
+from array import array
+
+# Same weighting as the category score increments in update_user_preferences
+EVENT_WEIGHTS = {'like': 3, 'share': 2, 'view': 1}
+
+
+class CountMinSketch:
+    """Fixed-size approximate counter. Estimates never undercount."""
+
+    def __init__(self, width=1024, depth=4):
+        self.width = width
+        self.depth = depth
+        self._rows = [array('d', bytes(8 * width)) for _ in range(depth)]
+
+    def _columns(self, key):
+        # One independent 32-bit hash per row, sliced from a single digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.depth).digest()
+        width = self.width
+        return [int.from_bytes(digest[i:i + 4], 'little') % width for i in range(0, 4 * self.depth, 4)]
+
+    def add(self, key, count=1.0):
+        for row, column in zip(self._rows, self._columns(key)):
+            row[column] += count
+
+    def estimate(self, key, columns=None):
+        """Estimated count for key. Sketches of the same shape can share columns."""
+        columns = columns or self._columns(key)
+        return min(row[column] for row, column in zip(self._rows, columns))
+
+    def clear(self):
+        for row in self._rows:
+            row[:] = array('d', bytes(8 * self.width))
+
+
+class TrendingAggregator:
+    """Decayed like/share/view counts per article over a sliding window.
+
+    The window is a ring of time buckets, each holding one count-min sketch
+    per event type. Older buckets count for less (exponential decay by
+    half_life) and drop out entirely once the ring wraps around. A bounded
+    candidate set keeps track of the heavy hitters for top-k queries.
+    """
+
+    def __init__(self, bucket_seconds=300, num_buckets=24, half_life_seconds=3600,
+                 candidate_capacity=500, width=1024, depth=4):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = num_buckets
+        self.half_life_seconds = half_life_seconds
+        self.candidate_capacity = candidate_capacity
+        self._lock = threading.Lock()
+        self._buckets = [
+            {event_type: CountMinSketch(width, depth) for event_type in EVENT_WEIGHTS}
+            for _ in range(num_buckets)
+        ]
+        # Which absolute bucket number each ring slot currently holds
+        self._bucket_epochs = [None] * num_buckets
+        self._candidates = {}
+        self.events_recorded = 0
+
+    def _slot(self, epoch):
+        """Return the ring slot for epoch, clearing it if it holds an expired bucket"""
+        slot = epoch % self.num_buckets
+        if self._bucket_epochs[slot] != epoch:
+            for sketch in self._buckets[slot].values():
+                sketch.clear()
+            self._bucket_epochs[slot] = epoch
+        return slot
+
+    def record(self, article_id, event_type, now=None):
+        """Count one engagement event. Unknown event types are ignored."""
+        if not article_id or event_type not in EVENT_WEIGHTS:
+            return False
+
+        now = time.time() if now is None else now
+        epoch = int(now // self.bucket_seconds)
+
+        with self._lock:
+            # Late events whose bucket has already been recycled are dropped
+            held_epoch = self._bucket_epochs[epoch % self.num_buckets]
+            if held_epoch is not None and held_epoch > epoch:
+                return False
+
+            slot = self._slot(epoch)
+            self._buckets[slot][event_type].add(article_id)
+            self._candidates[article_id] = now
+            self.events_recorded += 1
+
+            if len(self._candidates) > 2 * self.candidate_capacity:
+                self._prune_candidates(now)
+
+        return True
+
+    def _decay_weights(self, now):
+        """(slot, weight) for every bucket still inside the window"""
+        current_epoch = int(now // self.bucket_seconds)
+        weights = []
+        for slot, epoch in enumerate(self._bucket_epochs):
+            if epoch is None:
+                continue
+            age_buckets = current_epoch - epoch
+            if age_buckets < 0 or age_buckets >= self.num_buckets:
+                continue
+            age_seconds = age_buckets * self.bucket_seconds
+            weights.append((slot, 0.5 ** (age_seconds / self.half_life_seconds)))
+        return weights
+
+    def _counts(self, article_id, weights):
+        counts = dict.fromkeys(EVENT_WEIGHTS, 0.0)
+        columns = self._buckets[0]['like']._columns(article_id)
+        for slot, weight in weights:
+            for event_type, sketch in self._buckets[slot].items():
+                counts[event_type] += weight * sketch.estimate(article_id, columns)
+        return counts
+
+    @staticmethod
+    def _score(counts):
+        return sum(EVENT_WEIGHTS[event_type] * count for event_type, count in counts.items())
+
+    def _prune_candidates(self, now):
+        """Keep only the highest scoring candidates"""
+        weights = self._decay_weights(now)
+        scored = [
+            (self._score(self._counts(article_id, weights)), article_id)
+            for article_id in self._candidates
+        ]
+        keep = heapq.nlargest(self.candidate_capacity, scored)
+        self._candidates = {article_id: self._candidates[article_id] for score, article_id in keep if score > 0}
+
+    def counts(self, article_id, now=None):
+        """Decayed like/share/view counts for one article"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._counts(article_id, self._decay_weights(now))
+
+    def score(self, article_id, now=None):
+        """Decayed, event-weighted popularity of one article"""
+        return self._score(self.counts(article_id, now))
+
+    def top(self, k=20, now=None):
+        """Return up to k (article_id, score, counts) tuples, most popular first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            weights = self._decay_weights(now)
+            scored = []
+            for article_id in self._candidates:
+                counts = self._counts(article_id, weights)
+                score = self._score(counts)
+                if score > 0:
+                    scored.append((score, article_id, counts))
+
+        top = heapq.nlargest(k, scored, key=lambda item: item[0])
+        return [(article_id, score, counts) for score, article_id, counts in top]